@@ -1,19 +1,66 @@
 # app.py — AI Trader by SO • v4.9.1 UI + silnik v52 (Stooq/CSV + proxy + Auto-Tune)
+# Ciężkie importy (plotly, requests, autotune) są leniwe — zimny start renderuje pierwszą stronę bez nich.
+import os
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import requests, time, io
+import time
 
-from core.data import from_csv, from_stooq
+from core.data import from_csv, from_stooq, fetch_stooq, parse_stooq_text, TimeframeCache
 from core.signals import SignalParams, compute_features, partial_signals, ensemble_score, dynamic_thresholds
 from core.sentiment import heuristic_from_vix
-from core.backtest import backtest, metrics
-from core.autotune import grid_space, walk_forward
+from core.align import AlignedData
+from core.backtest import backtest, metrics, trade_ledger, trade_stats
+from core.downsample import downsample
 from core.risk import volatility_target_position
+from core.snapshot import fingerprint, save_snapshot, latest_snapshot, SNAPSHOT_ERRORS
+
+SNAPSHOT_DIR = os.environ.get("AI_TRADER_SNAPSHOT_DIR", ".snapshots")
+
+
+def _stooq_text(symbol: str, max_age: float = 60.0):
+    """Surowy CSV ze Stooq — jedno pobranie na ticker, współdzielone przez podgląd i ładowanie."""
+    cached = st.session_state.get("stooq_raw")
+    if cached and cached["symbol"] == symbol and time.time() - cached["at"] < max_age:
+        return cached["text"], cached["info"]
+    text, info = fetch_stooq(symbol)
+    st.session_state.stooq_raw = {"symbol": symbol, "text": text, "info": info, "at": time.time()}
+    return text, info
+
+
+def _timings(info: dict) -> str:
+    return " • ".join(f"{a['source']}: {a['seconds']:.2f}s{'' if not a['error'] else ' ✗'}" for a in info["attempts"])
+
+
+def _restore_session(name: str):
+    """Po restarcie/redeployu: sesja bez danych bierze zrzut dla wybranego tickera/interwału zamiast pobierać od nowa."""
+    if st.session_state.get("df") is not None or st.session_state.get("snapshot_checked") == name:
+        return
+    st.session_state.snapshot_checked = name
+    snap = latest_snapshot(SNAPSHOT_DIR, name)
+    if snap is None or "df" not in snap:
+        return
+    try:
+        df = snap.frame("df")
+    except SNAPSHOT_ERRORS:
+        return  # uszkodzony zrzut — zwykła ścieżka ładowania
+    st.session_state.update(df=df, data_ok=True, snapshot=snap,
+                            used_source=f"{snap.meta.get('used_source')} (snapshot)",
+                            last_tuning=snap.meta.get("tuning"))
+
+
+def _persist(name: str, fp: str, frames: dict, meta: dict):
+    """Zrzut danych + wyników potoku (tylko gdy zmienił się fingerprint)."""
+    if st.session_state.get("snapshot_fp") == fp:
+        return
+    try:
+        save_snapshot(SNAPSHOT_DIR, name, frames, dict(meta, fingerprint=fp, tuning=st.session_state.get("last_tuning")))
+        st.session_state.snapshot_fp = fp
+    except OSError:
+        pass  # brak zapisu na dysk nie blokuje aplikacji
+
+
 # --- Left: input data (CSV / Stooq) + preview + ręczne linki + load ---
 with left:
-    import io, time, requests
-
     st.markdown("### Input data ↩️")
     src = st.radio("Source", ["Upload CSV", "Stooq"], horizontal=True, index=1)
     interval = st.selectbox("Interval", ["D1"], index=0, disabled=True)  # placeholder na przyszłość
@@ -44,11 +91,9 @@ with left:
     # Podgląd pierwszych linii dla Stooq
     if preview_click and src=="Stooq":
         try:
-            sym = symbol.strip().lower().replace("^","").replace("/","").replace("=","")
-            url = f"https://stooq.pl/q/d/l/?s={sym}&i=d&_={int(time.time())}"
-            r = requests.get(url, timeout=12, headers={"User-Agent":"Mozilla/5.0","Accept":"text/csv"})
-            r.raise_for_status()
-            st.code("\n".join((r.text or "").splitlines()[:6]) or "(pusto)", language="text")
+            txt, info = _stooq_text(symbol)
+            st.code("\n".join(txt.splitlines()[:6]) or "(pusto)", language="text")
+            st.caption(f"⏱️ {_timings(info)}")
         except Exception as e:
             st.error(f"Preview failed: {e}")
 
@@ -69,28 +114,18 @@ with left:
                     st.session_state.update(df=_df, used_source="CSV", data_ok=True)
                     st.success(f"✅ CSV OK: {len(_df)} wierszy.")
             else:
-                # Stooq
-                sym = symbol.strip().lower().replace("^","").replace("/","").replace("=","")
+                # Stooq — jedno pobranie, sniffing i parsowanie w pamięci
                 forced = None
                 if sep_choice != "Auto":
                     forced = "\t" if sep_choice == "\\t" else sep_choice
-                else:
-                    sniff_url = f"https://stooq.pl/q/d/l/?s={sym}&i=d&_={int(time.time())}"
-                    r = requests.get(sniff_url, timeout=12, headers={"User-Agent":"Mozilla/5.0","Accept":"text/csv"})
-                    r.raise_for_status()
-                    header = (r.text or "").splitlines()[0] if (r.text or "") else ""
-                    if ";" in header: forced = ";"
-                    elif "," in header: forced = ","
-                    elif "\t" in header: forced = "\t"
-                    if not header or header.lstrip().startswith("<"):
-                        raise ValueError("Stooq zwrócił pusty/HTML – spróbuj ponownie lub użyj CSV.")
-
-                _df = from_stooq(symbol, forced_sep=forced)
-                st.session_state.update(df=_df, used_source="Stooq", data_ok=True)
-                st.success(f"✅ Stooq OK: {len(_df)} wierszy. (sep={forced or 'auto'})")
+                txt, info = _stooq_text(symbol)
+                _df, used_sep = parse_stooq_text(txt, forced)
+                st.session_state.update(df=_df, used_source=f"Stooq ({info['source']})", data_ok=True)
+                st.success(f"✅ Stooq OK: {len(_df)} wierszy. (sep={used_sep or 'auto'})")
+                st.caption(f"⏱️ {_timings(info)}")
 
         except Exception as e:
-            # Reset i komunikaty + linki ręczne + jednorazowy proxy-fallback
+            # Reset i komunikaty + linki ręczne (proxy było już próbowane w fetch_stooq)
             st.session_state.update(data_ok=False, df=None, used_source=None)
             st.error(f"❌ Błąd wczytywania: {e}")
 
@@ -103,46 +138,6 @@ with left:
                         f"[Proxy]({proxy_url})  \n"
                         "Zapisz plik i wgraj go opcją **Upload CSV**.")
 
-            # Próbujemy raz pobrać proxy po stronie serwera i załadować automatycznie
-            try:
-                rproxy = requests.get(proxy_url, timeout=12, headers={"User-Agent":"Mozilla/5.0"})
-                rproxy.raise_for_status()
-                txt = (rproxy.text or "").strip()
-                if txt and not txt.lstrip().startswith("<"):
-                    # Autodetekcja separatora -> normalizacja -> Date index, Close col
-                    try:
-                        df_try = pd.read_csv(io.StringIO(txt), sep=None, engine="python")
-                    except Exception:
-                        df_try = None
-                    if df_try is None or df_try.empty:
-                        for s in (";", ",", "\t"):
-                            try:
-                                df_try = pd.read_csv(io.StringIO(txt), sep=s)
-                                if not df_try.empty:
-                                    break
-                            except Exception:
-                                pass
-                    if df_try is not None and not df_try.empty:
-                        df_try.columns = [str(c).strip() for c in df_try.columns]
-                        date_col = next((c for c in ("Date","Data") if c in df_try.columns), df_try.columns[0])
-                        close_col = next(
-                            (c for c in ("Close","Zamkniecie","Zamknięcie","Zamk.","Kurs","Price","Adj Close") if c in df_try.columns),
-                            (df_try.columns[4] if df_try.shape[1] >= 5 else df_try.columns[-1])
-                        )
-                        out = df_try[[date_col, close_col]].rename(columns={date_col:"Date", close_col:"Close"}).copy()
-                        out["Date"] = pd.to_datetime(out["Date"], errors="coerce").dt.tz_localize(None)
-                        out["Close"] = pd.to_numeric(out["Close"].astype(str).str.replace(",", ".", regex=False), errors="coerce")
-                        out = out.dropna().sort_values("Date").set_index("Date")[["Close"]]
-                        if not out.empty:
-                            st.success("✅ Proxy działa — dane załadowano automatycznie.")
-                            st.session_state.update(df=out, used_source="Stooq (proxy)", data_ok=True)
-                            csv_bytes = out.reset_index().to_csv(index=False).encode("utf-8")
-                            st.download_button("⬇️ Pobierz CSV (z serwera)", csv_bytes,
-                                               file_name=f"{sym_norm}_stooq.csv", mime="text/csv", use_container_width=True)
-                            st.stop()
-            except Exception:
-                pass  # zostawiamy instrukcję ręczną
-
     # Krótka diagnostyka po sukcesie
     if st.session_state.data_ok and st.session_state.df is not None:
         _df = st.session_state.df
@@ -208,7 +203,8 @@ c1, c2, c3, c4 = st.columns([1.2, 1.0, 1.4, 1.2], gap="medium")
 with c1:
     src = st.radio("Source", ["Upload CSV", "Stooq"], horizontal=True, index=1)
 with c2:
-    interval = st.selectbox("Interval", ["D1"], index=0, disabled=True)
+    interval = st.selectbox("Interval", ["D1", "W1", "M1", "H1", "H4"], index=0,
+                            help="Agregaty liczone z jednej serii bazowej (H1/H4 tylko z danych intraday)")
 with c3:
     start_bt = st.text_input("Backtest start (YYYY-MM-DD)", "2022-01-01")
 with c4:
@@ -232,11 +228,9 @@ with cB:
     sep_choice = st.selectbox("Separator", ["Auto", ",", ";", "\\t"], index=0)
     if st.button("🔎 Preview first lines (Stooq)", key="pv", use_container_width=True):
         try:
-            sym = symbol.strip().lower().replace("^","").replace("/","").replace("=","")
-            url = f"https://stooq.pl/q/d/l/?s={sym}&i=d&_={int(time.time())}"
-            r = requests.get(url, timeout=12, headers={"User-Agent":"Mozilla/5.0","Accept":"text/csv"})
-            r.raise_for_status()
-            st.code("\n".join((r.text or "").splitlines()[:5]) or "(empty)")
+            txt, info = _stooq_text(symbol)
+            st.code("\n".join(txt.splitlines()[:5]) or "(empty)")
+            st.caption(f"⏱️ {_timings(info)}")
         except Exception as e:
             st.error(f"Preview error: {e}")
 
@@ -244,6 +238,7 @@ with cB:
 st.session_state.setdefault("data_ok", False)
 st.session_state.setdefault("df", None)
 st.session_state.setdefault("used_source", None)
+_restore_session(f"{symbol}-{interval}")
 
 st.markdown("<div class='btn-ghost'>", unsafe_allow_html=True)
 load_click = st.button("Load data", use_container_width=True)
@@ -263,9 +258,11 @@ if load_click or (src == "Stooq" and 'get_stooq' in locals() and get_stooq):
             forced = None
             if sep_choice != "Auto":
                 forced = "\t" if sep_choice == "\\t" else sep_choice
-            df = from_stooq(symbol, forced_sep=forced)
-            st.session_state.update(df=df, data_ok=True, used_source="Stooq")
-            st.success(f"✅ Stooq OK: {len(df)} rows.")
+            txt, info = _stooq_text(symbol)
+            df, used_sep = parse_stooq_text(txt, forced)
+            st.session_state.update(df=df, data_ok=True, used_source=f"Stooq ({info['source']})")
+            st.success(f"✅ Stooq OK: {len(df)} rows. (sep={used_sep or 'auto'})")
+            st.caption(f"⏱️ {_timings(info)}")
     except Exception as e:
         st.session_state.update(data_ok=False, df=None, used_source=None)
         st.error(f"❌ Load error: {e}")
@@ -284,7 +281,18 @@ if not st.session_state.get("data_ok") or st.session_state.get("df") is None:
     st.stop()
 
 df = st.session_state.df.copy()
-close = df["Close"].dropna()
+# cache interwałów budowany raz na wczytaną serię bazową
+if st.session_state.get("tf_cache_src") != id(st.session_state.df):
+    st.session_state.tf_cache = TimeframeCache(st.session_state.df)
+    st.session_state.tf_cache_src = id(st.session_state.df)
+tf_cache = st.session_state.tf_cache
+if interval not in tf_cache.available():
+    st.warning(f"Interwał {interval} niedostępny dla tych danych — używam D1.")
+    interval = "D1"
+if interval == "D1" and tf_cache.base_step() >= pd.Timedelta(days=1):
+    close = df["Close"].dropna()  # dane już dzienne (lub rzadsze) — bez agregacji
+else:
+    close = tf_cache.get(interval)["Close"]
 
 
 # ---------------------------------------------------------------------
@@ -323,22 +331,56 @@ p.rsi_window, p.rsi_buy, p.rsi_sell = rsi_win, rsi_buy, rsi_sell
 
 
 # ---------------------------------------------------------------------
-# SENTIMENT
+# PIPELINE CACHE — ten sam fingerprint (dane + parametry) → wyniki z pamięci sesji albo ze zrzutu
 # ---------------------------------------------------------------------
-try:
-    vix = from_stooq("^vix")["Close"]
-    sent = heuristic_from_vix(vix).reindex(close.index).ffill()
-except Exception:
-    sent = pd.Series(0, index=close.index)
+fp = fingerprint(close, p.__dict__, interval)
+cached = st.session_state.get("pipeline")
+if (cached is None or cached["fp"] != fp) and st.session_state.get("snapshot") is not None:
+    snap = st.session_state.snapshot
+    if snap.meta.get("fingerprint") == fp and "feat" in snap and "pipeline" in snap:
+        try:
+            cached = {"fp": fp, "feat": snap.frame("feat"), "pipe": snap.frame("pipeline")}
+            st.session_state.pipeline = cached
+        except SNAPSHOT_ERRORS:
+            st.session_state.snapshot = None  # uszkodzony zrzut — przeliczamy potok od zera
+
+if cached is not None and cached["fp"] == fp:
+    feat, pipe = cached["feat"], cached["pipe"]
+    close = feat["Close"]
+    score, buy_thr, sell_thr, sent = pipe["score"], pipe["buy_thr"], pipe["sell_thr"], pipe["sentiment"]
+else:
+    # -----------------------------------------------------------------
+    # SENTIMENT
+    # -----------------------------------------------------------------
+    try:
+        vix = from_stooq("^vix")["Close"]
+        vix_sent = heuristic_from_vix(vix)
+    except Exception:
+        vix_sent = pd.Series(0.0, index=close.index)
+
+    # jeden as-of join na kalendarz Close — dalsze etapy dostają już wyrównane serie (bez reindex/ffill)
+    aligned = AlignedData.build(close, sentiment=vix_sent)
+    close = aligned.series("close")
+    sent = aligned.series("sentiment")
+
+    # -----------------------------------------------------------------
+    # SIGNALS
+    # -----------------------------------------------------------------
+    feat = compute_features(close, p)
+    sig  = partial_signals(feat, p)
+    score = ensemble_score(sig, sent, p)
+    buy_thr, sell_thr = dynamic_thresholds(score, p)
+
+    pipe = pd.DataFrame({"score": score, "buy_thr": buy_thr, "sell_thr": sell_thr, "sentiment": sent}, index=score.index)
+    st.session_state.pipeline = {"fp": fp, "feat": feat, "pipe": pipe}
+    _persist(f"{symbol}-{interval}", fp, {"df": st.session_state.df, "feat": feat, "pipeline": pipe},
+             {"symbol": symbol, "interval": interval, "used_source": st.session_state.get("used_source"),
+              "signal_params": p.__dict__})
 
 
 # ---------------------------------------------------------------------
-# SIGNALS + RECOMMENDATION
+# RECOMMENDATION
 # ---------------------------------------------------------------------
-feat = compute_features(close, p)
-sig  = partial_signals(feat, p)
-score = ensemble_score(sig, sent, p)
-buy_thr, sell_thr = dynamic_thresholds(score, p)
 
 last_score = float(score.iloc[-1])
 buy_now = float(buy_thr.iloc[-1] if isinstance(buy_thr, pd.Series) else buy_thr)
@@ -358,9 +400,44 @@ st.markdown(
 # ---------------------------------------------------------------------
 # CHART + BACKTEST + AUTO-TUNE (Light / Full)
 # ---------------------------------------------------------------------
-fig = go.Figure()
-fig.add_trace(go.Scatter(x=feat.index, y=feat["Close"], name="Close", mode="lines"))
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+CHART_POINTS = 2000  # budżet punktów na serię (LTTB)
+bt = backtest(close, score, buy_thr, sell_thr)
+
+t0, t1 = close.index[0].to_pydatetime(), close.index[-1].to_pydatetime()
+v1, v2 = st.columns([3,1], gap="medium")
+with v1:
+    view = st.slider("Zakres wykresu", min_value=t0, max_value=t1, value=(t0, t1), format="YYYY-MM-DD") if t1 > t0 else (t0, t1)
+with v2:
+    budget = st.select_slider("Punkty / seria", options=[500, 1000, 2000, 5000], value=CHART_POINTS)
+
+# każda seria redukowana osobno w obrębie widocznego zakresu → zawężenie zakresu = więcej detali
+fig = make_subplots(rows=3, cols=1, shared_xaxes=True, row_heights=[0.55, 0.2, 0.25], vertical_spacing=0.03)
+def _add_line(s, name, row, **kw):
+    d = downsample(s.loc[view[0]:view[1]].dropna(), budget)
+    fig.add_trace(go.Scatter(x=d.index, y=d.values, name=name, mode="lines", **kw), row=row, col=1)
+
+_add_line(feat["Close"], "Close", 1)
+_add_line(score, "Score", 2)
+for thr, name, color in ((buy_thr, "BUY_thr", "#00C389"), (sell_thr, "SELL_thr", "#FF5C7A")):
+    if isinstance(thr, pd.Series): _add_line(thr, name, 2, line=dict(dash="dot", color=color))
+    else: fig.add_hline(y=float(thr), line_dash="dot", line_color=color, row=2, col=1)
+_add_line(bt["eq"], "Equity", 3)
+_add_line(bt["bh"], "Buy&Hold", 3, line=dict(dash="dot"))
+fig.update_layout(height=640, margin=dict(l=10, r=10, t=10, b=10), hovermode="x unified")
 st.plotly_chart(fig, use_container_width=True, theme=None)
+n_view = int(close.loc[view[0]:view[1]].size)
+st.caption(f"Wykres: ≤{budget} pkt/serię z {n_view} barów (LTTB, zachowane ekstrema).")
+
+with st.expander("📒 Transakcje (dziennik + statystyki)"):
+    ledger = trade_ledger(close, bt["pos"])
+    if ledger.empty:
+        st.write("Brak transakcji w tym zakresie.")
+    else:
+        st.dataframe(trade_stats(ledger).round(4), use_container_width=True)
+        st.dataframe(ledger.drop(columns=["strategy"]).tail(50), use_container_width=True)
 
 def _quick_space():
     return {"rsi_window":[10,14,20],"rsi_buy":[25,30,35],"rsi_sell":[65,70,75],
@@ -370,6 +447,7 @@ def _quick_space():
             "percentile_window":[60,120],"percentile_mode":[True]}
 
 def _run_walk_forward_safely(space, folds, cost_bps):
+    from core.autotune import walk_forward
     dummy_sent = pd.Series(0, index=close.index)
     try: return walk_forward(close, space=space, folds=folds, cost_bps=cost_bps)
     except: return walk_forward(close, dummy_sent, space=space, folds=folds, cost_bps=cost_bps)
@@ -389,11 +467,18 @@ def _apply_best_params(best_params):
 def _autotune(profile:str):
     st.markdown(f"### 🔁 {profile} Auto-Tune")
     try:
+        from core.autotune import grid_space
         if profile=="Light": space=_quick_space(); folds=2; cost=10
         else: space=grid_space(); folds=4; cost=10
         results, stab=_run_walk_forward_safely(space, folds, cost)
-        best=max(results, key=lambda r:r.get('metrics_os',{}).get('sharpe',0))
-        _apply_best_params(best.get("best") or best.get("params"))
+        best=max(results, key=lambda r:r.get('metrics_os',{}).get('Sharpe',0))
+        st.session_state.last_tuning = [{"fold": r["fold"], "params": vars(r["params"]), "metrics_os": r["metrics_os"]}
+                                        for r in results]
+        st.session_state.snapshot_fp = None  # wymuś zapis wyników tuningu przy najbliższym przeliczeniu
+        _persist(f"{symbol}-{interval}", fp, {"df": st.session_state.df, "feat": feat, "pipeline": pipe},
+                 {"symbol": symbol, "interval": interval, "used_source": st.session_state.get("used_source"),
+                  "signal_params": p.__dict__})
+        _apply_best_params(vars(best["params"]))
     except Exception as e:
         st.error(f"Auto-Tune błąd: {e}")
 
@@ -408,3 +493,8 @@ with b2:
     st.markdown("</div>", unsafe_allow_html=True)
 with b3:
     st.button("⚡ Recompute", use_container_width=True)
+
+if st.session_state.get("last_tuning"):
+    with st.expander("🗂️ Ostatni Auto-Tune (OOS per fold)"):
+        st.dataframe(pd.DataFrame([{"fold": r["fold"], **{k: round(v, 4) for k, v in r["metrics_os"].items()}, **r["params"]}
+                                   for r in st.session_state.last_tuning]), use_container_width=True)
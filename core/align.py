@@ -0,0 +1,77 @@
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+
+def _match_tz(src: pd.Index, index: pd.Index) -> pd.Index:
+    """Strefa czasowa src jak w index (czas lokalny zachowany) — naive vs aware nie da się porównać."""
+    if not (isinstance(src, pd.DatetimeIndex) and isinstance(index, pd.DatetimeIndex)):
+        return src
+    if src.tz is not None and index.tz is None:
+        return src.tz_localize(None)
+    if src.tz is None and index.tz is not None:
+        return src.tz_localize(index.tz, ambiguous="NaT", nonexistent="shift_forward")
+    return src
+
+def _keys(ix: pd.Index) -> np.ndarray:
+    return ix.asi8 if isinstance(ix, pd.DatetimeIndex) else ix.to_numpy()
+
+def asof_positions(src: pd.Index, index: pd.Index) -> np.ndarray:
+    """Pozycja ostatniej obserwacji src <= każdy punkt index (-1 gdy brak)."""
+    return np.searchsorted(_keys(_match_tz(src, index)), _keys(index), side="right") - 1
+
+def align_to(s: pd.Series, index: pd.Index, fill: float | None = None) -> pd.Series:
+    """
+    As-of join serii na kalendarz `index`: ostatnia znana (nie-NaN) wartość z przeszłości, przed początkiem → fill.
+    Seria już na tym indeksie i bez NaN wraca bez kopii — kolejne etapy nie wyrównują jej ponownie.
+    """
+    if s.index is index or s.index.equals(index):
+        if not s.hasnans:
+            return s
+    src = s.dropna()
+    src.index = _match_tz(src.index, index)
+    src = src[src.index.notna()]
+    if not src.index.is_monotonic_increasing:
+        src = src.sort_index()
+    pos = asof_positions(src.index, index)
+    vals = src.to_numpy(dtype=float)[np.maximum(pos, 0)] if len(src) else np.full(len(index), np.nan)
+    out = np.where(pos >= 0, vals, np.nan if fill is None else fill)
+    return pd.Series(out, index=index, name=s.name)
+
+@dataclass
+class AlignedData:
+    """
+    Cena + sentyment + sizing na jednym kalendarzu (master = indeks Close), wyrównane raz przez as-of join.
+    Kolumny trzymane jako ciągłe tablice float64; view() daje wycinki pozycyjne bez kopii.
+    """
+    index: pd.Index
+    close: np.ndarray
+    sentiment: np.ndarray | None = None
+    size: np.ndarray | None = None
+    _series: dict = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def build(cls, close: pd.Series, sentiment: pd.Series | None = None, size: pd.Series | None = None,
+              sent_fill: float = 0.0, size_fill: float = 0.0) -> "AlignedData":
+        close = close.dropna()
+        index = close.index
+        def _arr(s, fill):
+            return None if s is None else np.ascontiguousarray(align_to(s, index, fill).to_numpy(dtype=float))
+        return cls(index, np.ascontiguousarray(close.to_numpy(dtype=float)), _arr(sentiment, sent_fill), _arr(size, size_fill))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def series(self, name: str) -> pd.Series | None:
+        """Kolumna jako pd.Series na wspólnym indeksie (ta sama instancja przy kolejnych wywołaniach)."""
+        arr = getattr(self, name)
+        if arr is None:
+            return None
+        if name not in self._series:
+            self._series[name] = pd.Series(arr, index=self.index, name=name.capitalize() if name == "close" else name, copy=False)
+        return self._series[name]
+
+    def view(self, start: int, end: int) -> "AlignedData":
+        """Wycinek pozycyjny [start, end) — widoki tablic, bez ponownego wyrównania."""
+        def _v(a):
+            return None if a is None else a[start:end]
+        return AlignedData(self.index[start:end], self.close[start:end], _v(self.sentiment), _v(self.size))
@@ -1,7 +1,14 @@
+from dataclasses import dataclass, field
 from itertools import product
+import heapq
+import numpy as np
 import pandas as pd
-from .signals import SignalParams, compute_features, partial_signals, ensemble_score, dynamic_thresholds
-from .backtest import backtest, metrics
+from .signals import (SignalParams, WEIGHT_FIELDS, compute_features, partial_signals, vote_matrix,
+                      weight_matrix, ensemble_scores, rolling_quantiles, dynamic_thresholds_batch)
+from .backtest import backtest_batch, metrics_batch
+from .align import align_to, AlignedData
+
+FOLD_SCHEMES = ("equal", "anchored", "rolling", "purged")
 
 def grid_space():
     return {
@@ -24,56 +31,360 @@ def grid_space():
         "percentile_window": [60,90,120],
     }
 
-def walk_forward(close: pd.Series, sentiment: pd.Series | None, space: dict, folds:int=4, cost_bps:int=10):
-    n = len(close)
-    fold_size = n // (folds+1)
+@dataclass
+class Fold:
+    """Granice foldu jako pozycje [start, end) w pełnej historii."""
+    index: int
+    train: list = field(default_factory=list)  # lista segmentów (start, end)
+    test: tuple = (0, 0)
+
+def make_folds(n: int, folds: int = 4, scheme: str = "equal",
+               train_size: int | None = None, test_size: int | None = None,
+               purge: int = 0, embargo: int = 0) -> list:
+    """
+    Generator foldów walk-forward / CV:
+    - equal:    rozłączne bloki IS/OOS po n // (folds+1) (dotychczasowe zachowanie)
+    - anchored: IS rośnie od początku historii, OOS = kolejne bloki na końcu
+    - rolling:  IS o stałej długości train_size przesuwa się razem z OOS
+    - purged:   k-fold CV; z IS usuwamy `purge` barów przed OOS i `embargo` barów po nim
+    """
+    if scheme not in FOLD_SCHEMES:
+        raise ValueError(f"Nieznany schemat foldów: {scheme} (dostępne: {', '.join(FOLD_SCHEMES)})")
+    if folds < 1:
+        raise ValueError("folds musi być >= 1.")
+    block = n // (folds+1)
+    out = []
+    if scheme == "purged":
+        test = test_size or n // folds
+        for f in range(folds):
+            os_start = f*test
+            os_end = n if f == folds-1 and not test_size else os_start + test
+            train = [(0, max(0, os_start-purge)), (min(n, os_end+embargo), n)]
+            out.append(Fold(f+1, [seg for seg in train if seg[1] > seg[0]], (os_start, os_end)))
+    else:
+        test = test_size or block
+        train = train_size or block
+        for f in range(folds):
+            if scheme == "equal":
+                is_start = f*train
+                os_start = is_start + train
+                is_end = os_start - purge
+            else:
+                os_start = n - (folds-f)*test
+                is_end = os_start - purge
+                is_start = 0 if scheme == "anchored" else max(0, is_end - train)
+            out.append(Fold(f+1, [(is_start, is_end)] if is_end > is_start else [], (os_start, os_start + test)))
+    for fd in out:
+        if not fd.train or fd.test[1] <= fd.test[0] or fd.test[0] < 0 or fd.test[1] > n:
+            raise ValueError(f"Za mało danych ({n} barów) dla schematu '{scheme}' i {folds} foldów.")
+    return out
+
+def _values(space: dict, name: str) -> list:
+    # brak wymiaru w siatce → wartość domyślna z SignalParams
+    return space.get(name, [getattr(SignalParams, name)])
+
+def _slice(x, start: int, end: int):
+    if isinstance(x, pd.Series):
+        return x.iloc[start:end]
+    return x[start:end] if isinstance(x, np.ndarray) else x
+
+def evaluate_segments(data: AlignedData | pd.Series, scores: np.ndarray, buy_thr, sell_thr,
+                      segments, cost_bps: int = 10) -> dict:
+    """Backtest K kolumn score na widokach pełnej historii; zwroty z kilku segmentów sklejamy bez luki cenowej."""
+    if isinstance(data, pd.Series):
+        data = AlignedData.build(data)
+    rets = []
+    for start, end in segments:
+        v = data.view(start, end)
+        bt = backtest_batch(v.close, _slice(scores, start, end), _slice(buy_thr, start, end),
+                            _slice(sell_thr, start, end), cost_bps/2, cost_bps/2, v.size)
+        rets.append(bt["ret"])
+    return metrics_batch(np.vstack(rets))
+
+INDICATOR_FIELDS = ("rsi_window", "ma_fast", "ma_mid", "ma_slow", "bb_window", "bb_std")
+
+def indicator_combos(space: dict) -> list:
+    """Konfiguracje wskaźników w kolejności przebiegu — jednostka podziału siatki na paczki."""
+    return list(product(*(_values(space, f) for f in INDICATOR_FIELDS)))
+
+def candidates_per_combo(space: dict) -> int:
+    n = 1
+    for f in ("rsi_buy", "rsi_sell", "score_buy", "score_sell", "percentile_mode", "percentile_window") + WEIGHT_FIELDS:
+        n *= len(_values(space, f))
+    return n
+
+def iter_candidate_batches(close: pd.Series, sentiment: pd.Series | None, space: dict, combos=None):
+    """
+    Przebieg po siatce z jednym liczeniem cech na pełnej historii (przyczynowo) na konfigurację wskaźników.
+    Wszystkie kombinacje wag liczone naraz: macierz głosów (T x 5) @ wagi (5 x K).
+    combos: podzbiór indicator_combos(space) (paczka zadania); domyślnie cała siatka.
+    Zwraca (params[K], scores (T x K), buy_thr, sell_thr) — foldy biorą z tego tylko wycinki po indeksie.
+    """
+    sentiment = None if sentiment is None else align_to(sentiment, close.index, 0)
+    weights = list(product(*(_values(space, f) for f in WEIGHT_FIELDS)))
+    w_mat = np.array(weights, dtype=float).T
+    for rsi_w, ma_f, ma_m, ma_s, bb_w, bb_std in (indicator_combos(space) if combos is None else combos):
+        base = SignalParams(rsi_window=rsi_w, ma_fast=ma_f, ma_mid=ma_m, ma_slow=ma_s, bb_window=bb_w, bb_std=bb_std)
+        feat = compute_features(close, base)
+        for rsi_b, rsi_s in product(_values(space, "rsi_buy"), _values(space, "rsi_sell")):
+            base.rsi_buy, base.rsi_sell = rsi_b, rsi_s
+            scores = ensemble_scores(vote_matrix(partial_signals(feat, base), sentiment), w_mat)
+            quantiles = {}
+            for t_buy, t_sell, pm, pw in product(
+                _values(space, "score_buy"), _values(space, "score_sell"),
+                _values(space, "percentile_mode"), _values(space, "percentile_window")
+            ):
+                if pm and pw not in quantiles:
+                    quantiles[pw] = rolling_quantiles(scores, pw)
+                params = [SignalParams(
+                    rsi_window=rsi_w, rsi_buy=rsi_b, rsi_sell=rsi_s,
+                    ma_fast=ma_f, ma_mid=ma_m, ma_slow=ma_s,
+                    bb_window=bb_w, bb_std=bb_std,
+                    w_rsi=wr, w_ma=wm, w_bb=wbb, w_breakout=wbrk, w_sent=ws,
+                    score_buy=t_buy, score_sell=t_sell,
+                    percentile_mode=pm, percentile_window=pw
+                ) for wr, wm, wbb, wbrk, ws in weights]
+                buy_thr, sell_thr = dynamic_thresholds_batch(scores, params[0], quantiles.get(pw))
+                yield params, scores, buy_thr, sell_thr
+
+def _group_key(p: SignalParams) -> tuple:
+    return (p.rsi_window, p.ma_fast, p.ma_mid, p.ma_slow, p.ma_type, p.bb_window, p.bb_std, p.rsi_buy, p.rsi_sell,
+            p.score_buy, p.score_sell, p.percentile_mode, p.percentile_window)
+
+def iter_param_batches(close: pd.Series, sentiment: pd.Series | None, params):
+    """Jak iter_candidate_batches, ale dla dowolnej listy kandydatów (grupowanie po wszystkim poza wagami)."""
+    sentiment = None if sentiment is None else align_to(sentiment, close.index, 0)
+    groups = {}
+    for p in params:
+        groups.setdefault(_group_key(p), []).append(p)
+    for group in groups.values():
+        p0 = group[0]
+        sig = partial_signals(compute_features(close, p0), p0)
+        scores = ensemble_scores(vote_matrix(sig, sentiment), weight_matrix(group))
+        buy_thr, sell_thr = dynamic_thresholds_batch(scores, p0)
+        yield group, scores, buy_thr, sell_thr
+
+class RunningStats:
+    """Średnia/wariancja online (Welford; partie łączone wzorem Chana) — stała pamięć."""
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+
+    def update(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        mean_b = float(values.mean())
+        self.merge(len(values), mean_b, float(((values - mean_b)**2).sum()))
+
+    def merge(self, n_b: int, mean_b: float, m2_b: float):
+        if n_b == 0:
+            return
+        n = self.count + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta**2 * self.count * n_b / n
+        self.count = n
+
+    @property
+    def var(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+class SweepTelemetry:
+    """
+    Strumieniowa telemetria przebiegu po siatce, pamięć niezależna od rozmiaru siatki:
+    - top_k kandydatów IS per fold (kopiec, klucz (Sharpe, CAGR), przy remisie wcześniejszy kandydat)
+    - marginalne statystyki Sharpe IS dla każdej wartości każdego parametru (RunningStats)
+    """
+
+    def __init__(self, n_folds: int, top_k: int = 20):
+        self.top_k = top_k
+        self.heaps = [[] for _ in range(n_folds)]
+        self.stats: dict[tuple, RunningStats] = {}
+        self.seen = 0
+
+    def _push(self, fold: int, item: tuple) -> bool:
+        heap = self.heaps[fold]
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, item)
+        elif item[:3] > heap[0][:3]:
+            heapq.heapreplace(heap, item)
+        else:
+            return False
+        return True
+
+    def update(self, fold: int, params: list, m: dict, seq: int, values: dict | None = None):
+        sharpe, cagr = m["Sharpe"], m["CAGR"]
+        for j in np.lexsort((np.arange(len(params)), -cagr, -sharpe))[:self.top_k]:
+            if not self._push(fold, (float(sharpe[j]), float(cagr[j]), -(seq + int(j)), params[j])):
+                break  # kolejne w tej partii są jeszcze gorsze
+        for name, col in (values or _param_values(params)).items():
+            if len(col) == 1:
+                self.stats.setdefault((name, col[0][0]), RunningStats()).update(sharpe)
+                continue
+            for v, mask in col:
+                self.stats.setdefault((name, v), RunningStats()).update(sharpe[mask])
+        self.seen += len(params)
+
+    def to_dict(self) -> dict:
+        """Zwarta postać JSON (wynik zadania rozproszonego)."""
+        return {
+            "top_k": self.top_k,
+            "seen": self.seen,
+            "heaps": [[[sh, cg, s, p.__dict__] for sh, cg, s, p in heap] for heap in self.heaps],
+            "stats": [[k, v, r.count, r.mean, r.m2] for (k, v), r in self.stats.items()],
+        }
+
+    def absorb(self, data: dict, folds: list | None = None):
+        """Dołącz telemetrię z to_dict(); folds mapuje jej kolejne kopce na foldy tej instancji."""
+        for i, heap in zip(folds or range(len(data["heaps"])), data["heaps"]):
+            for sh, cg, s, p in heap:
+                self._push(i, (sh, cg, s, SignalParams(**p)))
+        for k, v, n, mean, m2 in data["stats"]:
+            self.stats.setdefault((k, v), RunningStats()).merge(n, mean, m2)
+        self.seen += data["seen"]
+
+    def ranking(self, fold: int) -> list:
+        return [((sh, cg), p) for sh, cg, _, p in sorted(self.heaps[fold], key=lambda x: x[:3], reverse=True)]
+
+    def marginals(self) -> pd.DataFrame:
+        rows = [{"param": k, "value": v, "count": r.count, "mean": r.mean, "std": float(np.sqrt(r.var))}
+                for (k, v), r in self.stats.items()]
+        return pd.DataFrame(rows, columns=["param", "value", "count", "mean", "std"])
+
+    def prunable(self, tol: float = 0.05) -> dict:
+        """Wymiary, w których średni Sharpe różni się między wartościami o < tol → można przypiąć najlepszą."""
+        out = {}
+        m = self.marginals()
+        for name, g in m.groupby("param"):
+            if len(g) > 1 and g["mean"].max() - g["mean"].min() < tol:
+                out[name] = g.loc[g["mean"].idxmax(), "value"]
+        return out
+
+def _param_values(params: list) -> dict:
+    """{parametr: [(wartość, maska)]} dla partii kandydatów; liczone raz na partię, nie na fold."""
+    out = {}
+    for name in SignalParams.__dataclass_fields__:
+        col = [getattr(p, name) for p in params]
+        uniq = list(dict.fromkeys(col))
+        if len(uniq) == 1:
+            out[name] = [(uniq[0], None)]
+        else:
+            arr = np.array(col, dtype=object)
+            out[name] = [(v, arr == v) for v in uniq]
+    return out
+
+def _rank(batches, data: AlignedData, fold_list: list, cost_bps: int, top_n: int, seq: int = 0) -> SweepTelemetry:
+    tel = SweepTelemetry(len(fold_list), top_n)
+    for params, scores, buy_thr, sell_thr in batches:
+        values = _param_values(params)
+        for i, fd in enumerate(fold_list):
+            tel.update(i, params, evaluate_segments(data, scores, buy_thr, sell_thr, fd.train, cost_bps), seq, values)
+        seq += len(params)
+    return tel
+
+def _evaluate_oos(data: AlignedData, p: SignalParams, fd: Fold, cost_bps: int) -> dict:
+    params, scores, buy_thr, sell_thr = next(iter_param_batches(data.series("close"), data.series("sentiment"), [p]))
+    return {k: float(v[0]) for k, v in evaluate_segments(data, scores, buy_thr, sell_thr, [fd.test], cost_bps).items()}
+
+@dataclass
+class TuneState:
+    """Stan walk-forward do inkrementalnego re-tune: granice foldów, p_star i ranking kandydatów IS."""
+    config: dict
+    n: int
+    folds: list
+    ranking: list
+    results: list
+    telemetry: SweepTelemetry | None = None
+
+def tune(close: pd.Series, sentiment: pd.Series | None, space: dict, folds:int=4, cost_bps:int=10,
+         scheme: str = "equal", train_size: int | None = None, test_size: int | None = None,
+         purge: int = 0, embargo: int = 0, top_n: int = 20, size: pd.Series | None = None) -> TuneState:
+    """
+    Pełny walk-forward po siatce; zapamiętuje top_n kandydatów per fold dla retune().
+    Cena/sentyment/sizing wyrównane raz (AlignedData) — foldy biorą tylko widoki pozycyjne.
+    """
+    data = AlignedData.build(close, sentiment, size)
+    fold_list = make_folds(len(data), folds, scheme, train_size, test_size, purge, embargo)
+    batches = iter_candidate_batches(data.series("close"), data.series("sentiment"), space)
+    telemetry = _rank(batches, data, fold_list, cost_bps, top_n)
+    return state_from_telemetry(data, fold_list, telemetry, scheme, cost_bps, purge)
+
+def state_from_telemetry(data: AlignedData, fold_list: list, telemetry: SweepTelemetry,
+                         scheme: str, cost_bps: int, purge: int) -> TuneState:
+    """p_star = czołówka rankingu IS każdego foldu → OOS; wspólne dla tune() i trybu rozproszonego."""
+    ranking = [telemetry.ranking(i) for i in range(len(fold_list))]
     results = []
-    for f in range(folds):
-        is_start = f*fold_size
-        is_end = is_start + fold_size
-        os_start = is_end
-        os_end = os_start + fold_size
-        close_is = close.iloc[is_start:is_end]
-        close_os = close.iloc[os_start:os_end]
-        sent_is = None if sentiment is None else sentiment.reindex(close_is.index).fillna(method="ffill")
-        sent_os = None if sentiment is None else sentiment.reindex(close_os.index).fillna(method="ffill")
-        best = None
-        for rsi_w, rsi_b, rsi_s, ma_f, ma_m, ma_s, bb_w, bb_std, wr, wm, wbb, wbrk, ws, t_buy, t_sell, pm, pw in product(
-            space["rsi_window"], space["rsi_buy"], space["rsi_sell"],
-            space["ma_fast"], space["ma_mid"], space["ma_slow"],
-            space["bb_window"], space["bb_std"],
-            space["w_rsi"], space["w_ma"], space["w_bb"], space["w_breakout"], space["w_sent"],
-            space["score_buy"], space["score_sell"], space["percentile_mode"], space["percentile_window"]
-        ):
-            p = SignalParams(
-                rsi_window=rsi_w, rsi_buy=rsi_b, rsi_sell=rsi_s,
-                ma_fast=ma_f, ma_mid=ma_m, ma_slow=ma_s,
-                bb_window=bb_w, bb_std=bb_std,
-                w_rsi=wr, w_ma=wm, w_bb=wbb, w_breakout=wbrk, w_sent=ws,
-                score_buy=t_buy, score_sell=t_sell,
-                percentile_mode=pm, percentile_window=pw
-            )
-            feat_is = compute_features(close_is, p)
-            sig_is = partial_signals(feat_is, p)
-            sc_is = ensemble_score(sig_is, sent_is, p)
-            buy_thr_is, sell_thr_is = dynamic_thresholds(sc_is, p)
-            bt_is = backtest(close_is, sc_is, buy_thr_is, sell_thr_is, cost_bps/2, cost_bps/2)
-            m_is = metrics(bt_is["eq"], bt_is["ret"])
-            key = (m_is["Sharpe"], m_is["CAGR"])
-            if (best is None) or (key > best[0]):
-                best = (key, p)
-        p_star = best[1]
-        feat_os = compute_features(close_os, p_star)
-        sig_os = partial_signals(feat_os, p_star)
-        sc_os = ensemble_score(sig_os, sent_os, p_star)
-        buy_thr_os, sell_thr_os = dynamic_thresholds(sc_os, p_star)
-        bt_os = backtest(close_os, sc_os, buy_thr_os, sell_thr_os, cost_bps/2, cost_bps/2)
-        m_os = metrics(bt_os["eq"], bt_os["ret"])
-        results.append({"fold": f+1, "params": p_star, "metrics_os": m_os})
+    for fd, rank in zip(fold_list, ranking):
+        p_star = rank[0][1]
+        results.append({"fold": fd.index, "params": p_star, "metrics_os": _evaluate_oos(data, p_star, fd, cost_bps),
+                        "train": fd.train, "test": fd.test})
+    last = fold_list[-1]
+    config = {"scheme": scheme, "cost_bps": cost_bps, "purge": purge, "top_n": telemetry.top_k,
+              "test_len": last.test[1] - last.test[0], "train_len": last.train[-1][1] - last.train[-1][0]}
+    return TuneState(config, len(data), fold_list, ranking, results, telemetry)
+
+def retune(close: pd.Series, sentiment: pd.Series | None, state: TuneState,
+           size: pd.Series | None = None) -> TuneState:
+    """
+    Re-tune po dopisaniu nowych barów (tylko append; cechy są przyczynowe, więc stare foldy się nie zmieniają).
+    - ostatni fold: okno OOS wydłużane do końca danych → przeliczany tylko OOS dla p_star
+    - gdy OOS urośnie do 2× długości bloku, odcinamy nowy fold; jego IS oceniamy tylko na top_n kandydatach
+      z rankingu poprzedniego foldu (bez pełnej siatki)
+    Tylko schematy walk-forward (equal/anchored/rolling): w "purged" IS każdego foldu sięga końca danych,
+    więc nowe bary zmieniają wszystkie foldy — wtedy potrzebny pełny tune().
+    """
+    if state.config["scheme"] == "purged":
+        raise ValueError("retune(): schemat 'purged' (k-fold CV) wymaga pełnego tune() — IS każdego foldu sięga końca danych.")
+    data = AlignedData.build(close, sentiment, size)
+    n = len(data)
+    if n < state.n:
+        raise ValueError("retune(): seria krótsza niż przy poprzednim tuningu (dozwolone tylko dopisywanie barów).")
+    if n == state.n:
+        return state
+    cfg = state.config
+    folds = [Fold(f.index, list(f.train), f.test) for f in state.folds]
+    ranking = list(state.ranking)
+    results = list(state.results)
+    changed = {len(folds) - 1}
+    folds[-1].test = (folds[-1].test[0], n)
+    while folds[-1].test[1] - folds[-1].test[0] >= 2*cfg["test_len"]:
+        prev = folds[-1]
+        split = prev.test[0] + cfg["test_len"]
+        prev.test = (prev.test[0], split)
+        is_end = split - cfg["purge"]
+        if cfg["scheme"] == "rolling":
+            train = [(max(0, is_end - cfg["train_len"]), is_end)]
+        elif cfg["scheme"] == "equal":
+            train = [(prev.test[0], is_end)]
+        else:  # anchored
+            train = [(0, is_end)]
+        fd = Fold(prev.index + 1, train, (split, n))
+        candidates = [p for _, p in ranking[-1]]
+        batches = iter_param_batches(data.series("close"), data.series("sentiment"), candidates)
+        ranking.append(_rank(batches, data, [fd], cfg["cost_bps"], cfg["top_n"]).ranking(0))
+        folds.append(fd)
+        results.append(None)
+        changed.add(len(folds) - 1)
+    for i in sorted(changed):
+        fd, p_star = folds[i], ranking[i][0][1]
+        results[i] = {"fold": fd.index, "params": p_star,
+                      "metrics_os": _evaluate_oos(data, p_star, fd, cfg["cost_bps"]),
+                      "train": fd.train, "test": fd.test}
+    return TuneState(cfg, n, folds, ranking, results, state.telemetry)
+
+def stability_of(results: list) -> dict:
     stability = {}
     for r in results:
         p = r["params"]
         for k,v in p.__dict__.items():
             key = f"{k}:{v}"
             stability[key] = stability.get(key, 0) + 1
-    return results, stability
+    return stability
+
+def walk_forward(close: pd.Series, sentiment: pd.Series | None, space: dict, folds:int=4, cost_bps:int=10,
+                 scheme: str = "equal", train_size: int | None = None, test_size: int | None = None,
+                 purge: int = 0, embargo: int = 0):
+    state = tune(close, sentiment, space, folds, cost_bps, scheme, train_size, test_size, purge, embargo, top_n=1)
+    return state.results, stability_of(state.results)
@@ -1,12 +1,13 @@
 import numpy as np
 import pandas as pd
+from .align import align_to
 
 def backtest(close: pd.Series, score: pd.Series, buy_thr, sell_thr,
              tc_bps: float = 5, slip_bps: float = 5,
              size_series: pd.Series | None = None) -> pd.DataFrame:
     if isinstance(buy_thr, pd.Series):
-        buy_th = buy_thr.reindex(score.index).fillna(method="ffill").fillna(0.6)
-        sell_th = sell_thr.reindex(score.index).fillna(method="ffill").fillna(-0.6)
+        buy_th = align_to(buy_thr, score.index, 0.6)
+        sell_th = align_to(sell_thr, score.index, -0.6)
         sig = (score >= buy_th).astype(float)
         sig[score <= sell_th] = 0.0
     else:
@@ -14,7 +15,7 @@ def backtest(close: pd.Series, score: pd.Series, buy_thr, sell_thr,
         sig[score <= sell_thr] = 0.0
     sig = sig.shift(1).fillna(0)
     ret = close.pct_change().fillna(0)
-    pos = sig if size_series is None else (sig * size_series.reindex(sig.index).fillna(method="ffill").fillna(0))
+    pos = sig if size_series is None else (sig * align_to(size_series, sig.index, 0))
     churn = (pos.diff().abs()).fillna(pos.abs())
     cost = churn * (tc_bps + slip_bps) / 10000.0
     strat_ret = pos*ret - cost
@@ -35,3 +36,144 @@ def metrics(equity: pd.Series, ret: pd.Series) -> dict:
     hit = wins / max(wins+losses,1)
     pf = daily[daily>0].sum() / abs(daily[daily<0].sum()) if (daily[daily<0].sum())<0 else float("inf")
     return {"CAGR": float(cagr), "Vol": float(vol), "Sharpe": float(sharpe), "Sortino": float(sortino), "MaxDD": float(dd), "HitRate": float(hit), "ProfitFactor": float(pf)}
+
+def backtest_batch(close, scores: np.ndarray, buy_thr, sell_thr,
+                   tc_bps: float = 5, slip_bps: float = 5, size: np.ndarray | None = None) -> dict:
+    """
+    backtest() dla K kolumn score naraz (T x K); progi: skalar lub macierz (T x K) bez NaN.
+    close: Series albo tablica (widok AlignedData); size: wyrównany sizing (T,) jak size_series w backtest().
+    Zwraca {"ret", "pos"} jako macierze (T x K).
+    """
+    scores = np.asarray(scores, dtype=float)
+    if scores.ndim == 1:
+        scores = scores[:, None]
+    sig = (scores >= buy_thr).astype(float)
+    sig[scores <= sell_thr] = 0.0
+    pos = np.zeros_like(sig)
+    pos[1:] = sig[:-1]
+    if size is not None:
+        pos *= np.asarray(size, dtype=float)[:, None]
+    px = np.asarray(close, dtype=float)
+    ret = np.zeros(len(px))
+    if len(px) > 1:
+        ret[1:] = px[1:] / px[:-1] - 1
+    churn = np.abs(np.diff(pos, axis=0, prepend=0.0))
+    cost = churn * (tc_bps + slip_bps) / 10000.0
+    return {"ret": pos * ret[:, None] - cost, "pos": pos}
+
+def metrics_batch(ret: np.ndarray) -> dict:
+    """metrics() policzone kolumnami dla macierzy zwrotów (T x K); wartości jako tablice (K,)."""
+    ret = np.asarray(ret, dtype=float)
+    if ret.ndim == 1:
+        ret = ret[:, None]
+    n, k = ret.shape
+    eq = np.cumprod(1 + ret, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cagr = eq[-1]**(252/max(n,1)) - 1 if n > 0 else np.zeros(k)
+        std = ret.std(axis=0, ddof=1) if n > 1 else np.full(k, np.nan)
+        mean = ret.mean(axis=0) if n > 0 else np.zeros(k)
+        vol = np.nan_to_num(std)*np.sqrt(252) if n > 1 else np.zeros(k)
+        sharpe = np.where(std > 0, mean/std*np.sqrt(252), 0.0)
+        neg = ret < 0
+        n_neg = neg.sum(axis=0)
+        neg_ret = np.where(neg, ret, 0.0)
+        neg_sum = neg_ret.sum(axis=0)
+        neg_mean = neg_sum / np.maximum(n_neg, 1)
+        down_std = np.sqrt(np.where(neg, (ret - neg_mean)**2, 0.0).sum(axis=0) / (n_neg - 1))
+        sortino = np.where((n_neg > 1) & (down_std > 0), mean/down_std*np.sqrt(252), 0.0)
+        dd = (eq / np.maximum.accumulate(eq, axis=0) - 1).min(axis=0) if n > 0 else np.zeros(k)
+        wins = (ret > 0).sum(axis=0)
+        hit = wins / np.maximum(wins + n_neg, 1)
+        pos_sum = np.where(ret > 0, ret, 0.0).sum(axis=0)
+        pf = np.where(neg_sum < 0, pos_sum / np.abs(neg_sum), np.inf)
+    return {"CAGR": cagr, "Vol": vol, "Sharpe": sharpe, "Sortino": sortino, "MaxDD": dd, "HitRate": hit, "ProfitFactor": pf}
+
+def trade_ledger(close: pd.Series, pos, tc_bps: float = 5, slip_bps: float = 5) -> pd.DataFrame:
+    """
+    Dziennik transakcji z serii pozycji (run-length encoding pos != 0), bez pętli po barach.
+    pos: Series (T,) albo macierz/DataFrame (T x K) — wtedy kolumna "strategy" = numer kolumny.
+    Wejście na barze entry_bar oznacza zakup po Close[entry_bar-1] (sygnał przesunięty o 1 bar).
+    """
+    P = np.asarray(pos, dtype=float)
+    if P.ndim == 1:
+        P = P[:, None]
+    P = np.nan_to_num(P)
+    T, K = P.shape
+    px = close.to_numpy(dtype=float)
+    ret = np.zeros(T)
+    if T > 1:
+        ret[1:] = px[1:] / px[:-1] - 1
+    cost = np.abs(np.diff(P, axis=0, prepend=0.0)) * (tc_bps + slip_bps) / 10000.0
+    gross = P * ret[:, None]
+    zero = np.zeros((1, K))
+    G = np.vstack([zero, np.cumsum(np.log1p(gross), axis=0)])
+    N = np.vstack([zero, np.cumsum(np.log1p(gross - cost), axis=0)])
+    C = np.vstack([zero, np.cumsum(cost, axis=0)])
+    S = np.vstack([zero, np.cumsum(P, axis=0)])
+
+    active = P != 0
+    edges = np.diff(active.astype(np.int8), axis=0, prepend=0, append=0).T  # (K x T+1)
+    sk, si = np.nonzero(edges == 1)
+    _, ej = np.nonzero(edges == -1)
+    ej = ej - 1  # ostatni bar z pozycją
+    if len(si) == 0:
+        return pd.DataFrame(columns=["strategy", "entry_bar", "exit_bar", "entry_date", "exit_date", "bars", "size",
+                                     "entry_px", "exit_px", "pnl_gross", "cost", "pnl", "mae", "mfe", "open"])
+
+    exit_cost = np.where(ej + 1 < T, cost[np.minimum(ej + 1, T - 1), sk], 0.0)
+    pnl_gross = np.exp(G[ej + 1, sk] - G[si, sk]) - 1
+    pnl = np.exp(N[ej + 1, sk] - N[si, sk]) * (1 - exit_cost) - 1
+
+    # MAE/MFE: ścieżka brutto względem wejścia, tylko na barach transakcji; min/max segmentami (reduceat)
+    base = np.full((T, K), np.nan)
+    base[si, sk] = G[si, sk]
+    fill = np.where(~np.isnan(base), np.arange(T)[:, None], 0)
+    np.maximum.accumulate(fill, axis=0, out=fill)
+    path = np.exp(G[1:] - base[fill, np.arange(K)]) - 1
+    flat_start = sk * T + si
+    lo = np.minimum.reduceat(np.where(active, path, np.inf).T.ravel(), flat_start)
+    hi = np.maximum.reduceat(np.where(active, path, -np.inf).T.ravel(), flat_start)
+
+    bars = ej - si + 1
+    idx = close.index
+    return pd.DataFrame({
+        "strategy": sk,
+        "entry_bar": si,
+        "exit_bar": ej,
+        "entry_date": idx[np.maximum(si - 1, 0)],
+        "exit_date": idx[ej],
+        "bars": bars,
+        "size": (S[ej + 1, sk] - S[si, sk]) / bars,
+        "entry_px": px[np.maximum(si - 1, 0)],
+        "exit_px": px[ej],
+        "pnl_gross": pnl_gross,
+        "cost": C[ej + 1, sk] - C[si, sk] + exit_cost,
+        "pnl": pnl,
+        "mae": np.minimum(lo, 0.0),
+        "mfe": np.maximum(hi, 0.0),
+        "open": ej == T - 1,
+    })
+
+def trade_stats(ledger: pd.DataFrame) -> pd.DataFrame:
+    """Statystyki na poziomie transakcji (per strategy): liczba, HitRate, payoff, PF, expectancy, średni czas."""
+    g = ledger.assign(
+        win=(ledger["pnl"] > 0).astype(float),
+        gain=ledger["pnl"].clip(lower=0),
+        loss=(-ledger["pnl"]).clip(lower=0),
+    ).groupby("strategy")
+    out = pd.DataFrame({
+        "Trades": g.size(),
+        "HitRate": g["win"].mean(),
+        "AvgPnL": g["pnl"].mean(),
+        "AvgWin": g["gain"].sum() / g["win"].sum().clip(lower=1),
+        "AvgLoss": g["loss"].sum() / (g.size() - g["win"].sum()).clip(lower=1),
+        "ProfitFactor": g["gain"].sum() / g["loss"].sum().replace(0, np.nan),
+        "AvgBars": g["bars"].mean(),
+        "WorstMAE": g["mae"].min(),
+        "BestMFE": g["mfe"].max(),
+        "Cost": g["cost"].sum(),
+    })
+    out["Payoff"] = out["AvgWin"] / out["AvgLoss"].replace(0, np.nan)
+    out["Expectancy"] = out["HitRate"]*out["AvgWin"] - (1 - out["HitRate"])*out["AvgLoss"]
+    out["ProfitFactor"] = out["ProfitFactor"].fillna(float("inf"))
+    return out
@@ -7,9 +7,12 @@ import csv
 from typing import Optional, Iterable
 
 import pandas as pd
-import requests
 
-__all__ = ["from_stooq", "from_csv", "direct_stooq_url", "proxy_stooq_url"]
+__all__ = [
+    "from_stooq", "from_csv", "direct_stooq_url", "proxy_stooq_url",
+    "fetch_stooq", "parse_stooq_text", "load_stooq",
+    "TIMEFRAMES", "resample_ohlc", "TimeframeCache",
+]
 
 
 def _norm_symbol(symbol: str) -> str:
@@ -92,71 +95,97 @@ def _try_text(text: str) -> Optional[pd.DataFrame]:
     return None
 
 
-def from_stooq(symbol: str, forced_sep: str | None = None) -> pd.DataFrame:
-    """
-    Pobierz dzienne notowania ze Stooq → DataFrame z indexem Date i kolumną Close.
-    - automatyczna detekcja separatora
-    - fallback: proxy r.jina.ai
-    - opcjonalne forced_sep: ',', ';', '\\t'
-    """
-    url = f"{direct_stooq_url(symbol)}&_={int(time.time())}"
+_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "text/csv,text/plain,*/*;q=0.9",
+    "Referer": "https://stooq.pl/",
+}
 
-    # 1) bezpośrednio — najpierw spróbuj od razu parsować
-    try:
-        if forced_sep:
-            df = pd.read_csv(url, sep=forced_sep, engine="python")
-        else:
-            df = pd.read_csv(url, sep=None, engine="python")
-        if df is not None and not df.empty:
-            return _normalize_df(df)
-    except Exception:
-        pass
 
-    # 2) pobierz jako tekst i próbuj ręcznie
-    try:
-        r = requests.get(
-            url,
-            timeout=12,
-            headers={
-                "User-Agent": "Mozilla/5.0",
-                "Accept": "text/csv,text/plain,*/*;q=0.9",
-                "Referer": "https://stooq.pl/",
-            },
-        )
-        r.raise_for_status()
-        txt = (r.text or "").strip()
-    except Exception as e:
-        raise ValueError(f"Stooq: błąd HTTP ({url}): {e}")
-
-    if not txt or txt.lstrip().startswith("<"):
-        # 3) proxy fallback (często działa na hostingach)
-        purl = f"{proxy_stooq_url(symbol)}&_={int(time.time())}"
-        pr = requests.get(purl, timeout=12, headers={"User-Agent": "Mozilla/5.0"})
-        pr.raise_for_status()
-        txt = (pr.text or "").strip()
-
-    if not txt or txt.lstrip().startswith("<"):
-        raise ValueError(f"Stooq: pusty/HTML-owy response ({url}).")
-
-    if forced_sep:
-        df2 = pd.read_csv(io.StringIO(txt), sep=forced_sep, engine="python")
-        return _normalize_df(df2)
-
-    df2 = _try_text(txt)
-    if df2 is not None:
-        return _normalize_df(df2)
-
-    # 4) inne kodowania + manual
+def _looks_like_csv(text: str) -> bool:
+    return bool(text) and not text.lstrip().startswith("<")
+
+
+def _decode(data: bytes) -> str:
     for enc in ("utf-8-sig", "cp1250", "iso-8859-2"):
         try:
-            dec = txt.encode("utf-8", errors="ignore").decode(enc, errors="ignore")
-            df3 = _try_text(dec)
-            if df3 is not None:
-                return _normalize_df(df3)
-        except Exception:
+            return data.decode(enc)
+        except UnicodeDecodeError:
             continue
+    return data.decode("utf-8", errors="ignore")
+
+
+def fetch_stooq(symbol: str, timeout: float = 12, session: "requests.Session | None" = None) -> tuple[str, dict]:
+    """
+    Jedno pobranie pliku ze Stooq: najpierw bezpośrednio, potem (tylko gdy trzeba) przez proxy.
+    Zwraca (tekst CSV, info) — info: source, url, attempts=[{source, url, status, bytes, seconds, error}].
+    """
+    if session is None:
+        import requests  # import leniwy: zimny start aplikacji bez sieci nie płaci za requests
+    http = session or requests
+    stamp = int(time.time())
+    attempts = []
+    for source, base in (("direct", direct_stooq_url(symbol)), ("proxy", proxy_stooq_url(symbol))):
+        url = f"{base}&_={stamp}"
+        t0 = time.perf_counter()
+        rec = {"source": source, "url": url, "status": None, "bytes": 0, "seconds": 0.0, "error": None}
+        attempts.append(rec)
+        try:
+            r = http.get(url, timeout=timeout, headers=_HEADERS if source == "direct" else {"User-Agent": "Mozilla/5.0"})
+            rec["status"] = r.status_code
+            r.raise_for_status()
+            data = r.content or b""
+            rec["bytes"] = len(data)
+            text = _decode(data).strip()
+            if _looks_like_csv(text):
+                return text, {"source": source, "url": url, "attempts": attempts}
+            rec["error"] = "pusty/HTML-owy response"
+        except Exception as e:
+            rec["error"] = str(e)
+        finally:
+            rec["seconds"] = time.perf_counter() - t0
+    errors = "; ".join(f"{a['source']}: {a['error']}" for a in attempts)
+    raise ValueError(f"Stooq: nie udało się pobrać danych ({errors}).")
+
+
+def parse_stooq_text(text: str, forced_sep: str | None = None) -> tuple[pd.DataFrame, str | None]:
+    """Parsowanie pobranego CSV w pamięci → (DataFrame Date/Close, użyty separator)."""
+    if not _looks_like_csv(text):
+        raise ValueError("Stooq: pusty/HTML-owy response.")
+    sep = forced_sep or _sniff_sep(text[:5000])
+    if sep:
+        try:
+            return _normalize_df(pd.read_csv(io.StringIO(text), sep=sep, engine="python")), sep
+        except Exception:
+            if forced_sep:
+                raise
+    df = _try_text(text)
+    if df is not None:
+        return _normalize_df(df), None
+    raise ValueError("Nie udało się sparsować CSV ze Stooq.")
+
+
+def load_stooq(symbol: str, forced_sep: str | None = None, timeout: float = 12,
+               session: "requests.Session | None" = None) -> tuple[pd.DataFrame, dict]:
+    """
+    Pobierz raz + sparsuj w pamięci. info zawiera surowy tekst (do podglądu),
+    źródło (direct/proxy), separator i czasy poszczególnych prób.
+    """
+    text, info = fetch_stooq(symbol, timeout=timeout, session=session)
+    t0 = time.perf_counter()
+    df, sep = parse_stooq_text(text, forced_sep)
+    info.update(text=text, sep=sep, parse_seconds=time.perf_counter() - t0)
+    return df, info
 
-    raise ValueError(f"Nie udało się sparsować CSV ze Stooq ({url}).")
+
+def from_stooq(symbol: str, forced_sep: str | None = None) -> pd.DataFrame:
+    """
+    Pobierz dzienne notowania ze Stooq → DataFrame z indexem Date i kolumną Close.
+    - jedno pobranie (direct → proxy r.jina.ai), parsowanie w pamięci
+    - automatyczna detekcja separatora
+    - opcjonalne forced_sep: ',', ';', '\\t'
+    """
+    return load_stooq(symbol, forced_sep)[0]
 
 
 def from_csv(file) -> pd.DataFrame:
@@ -184,3 +213,71 @@ def from_csv(file) -> pd.DataFrame:
             return _normalize_df(df2)
 
     raise ValueError("Nie udało się odczytać CSV (sprawdź separator i nagłówki).")
+
+
+# ---------------------------------------------------------------------
+# Multi-timeframe: agregaty z jednej serii bazowej (cache + inkrementalny update)
+# ---------------------------------------------------------------------
+TIMEFRAMES = {
+    "H1": pd.offsets.Hour(1),
+    "H4": pd.offsets.Hour(4),
+    "D1": pd.offsets.Day(1),
+    "W1": pd.offsets.Week(weekday=6),
+    "M1": pd.offsets.MonthEnd(),
+}
+
+
+def resample_ohlc(close: pd.Series, tf: str) -> pd.DataFrame:
+    """Agregacja Close → Open/High/Low/Close/Bars dla interwału tf (puste kubełki pomijane)."""
+    if tf not in TIMEFRAMES:
+        raise ValueError(f"Nieznany interwał: {tf} (dostępne: {', '.join(TIMEFRAMES)})")
+    r = close.resample(TIMEFRAMES[tf])
+    out = pd.DataFrame({"Open": r.first(), "High": r.max(), "Low": r.min(), "Close": r.last(), "Bars": r.count()})
+    return out[out["Bars"] > 0]
+
+
+class TimeframeCache:
+    """
+    Trzyma jedną serię bazową (Close) i leniwie liczone agregaty W1/M1 (oraz H1/H4 z danych intraday).
+    append() dolicza tylko ostatni, niedomknięty kubełek i nowe — bez ponownej agregacji całej historii.
+    """
+
+    def __init__(self, base: pd.Series | pd.DataFrame):
+        close = base["Close"] if isinstance(base, pd.DataFrame) else base
+        self.base = close.dropna().sort_index()
+        self._frames: dict[str, pd.DataFrame] = {}
+        self._tail_pos: dict[str, int] = {}  # pozycja w base, od której zaczyna się ostatni kubełek
+
+    def base_step(self) -> pd.Timedelta:
+        if len(self.base) < 2:
+            return pd.Timedelta(days=1)
+        return pd.Series(self.base.index).diff().median()
+
+    def available(self) -> list[str]:
+        """Interwały nie drobniejsze niż seria bazowa."""
+        step = self.base_step()
+        return [tf for tf, off in TIMEFRAMES.items()
+                if not isinstance(off, pd.offsets.Tick) or pd.Timedelta(off) >= step]
+
+    def get(self, tf: str) -> pd.DataFrame:
+        if tf not in self._frames:
+            if tf in TIMEFRAMES and tf not in self.available():
+                raise ValueError(f"Interwał {tf} jest drobniejszy niż dane bazowe.")
+            agg = resample_ohlc(self.base, tf)
+            self._frames[tf] = agg
+            self._tail_pos[tf] = len(self.base) - int(agg["Bars"].iloc[-1]) if len(agg) else 0
+        return self._frames[tf]
+
+    def append(self, new: pd.Series | pd.DataFrame) -> "TimeframeCache":
+        """Dołącz nowe bary bazowe (tylko późniejsze niż ostatni) i odśwież ogony zbuforowanych agregatów."""
+        close = (new["Close"] if isinstance(new, pd.DataFrame) else new).dropna().sort_index()
+        if close.empty:
+            return self
+        if len(self.base) and close.index[0] <= self.base.index[-1]:
+            raise ValueError("append(): nowe bary muszą być późniejsze niż ostatni bar bazowy.")
+        self.base = pd.concat([self.base, close])
+        for tf, agg in self._frames.items():
+            tail = resample_ohlc(self.base.iloc[self._tail_pos[tf]:], tf)
+            self._frames[tf] = pd.concat([agg.iloc[:-1], tail]) if len(agg) else tail
+            self._tail_pos[tf] = len(self.base) - int(tail["Bars"].iloc[-1])
+        return self
@@ -0,0 +1,313 @@
+# core/distributed.py — walk-forward na wielu hostach przez kolejkę plikową (bez brokera)
+#
+# Katalog kolejki (np. wspólny NFS):
+#   manifest.json              konfiguracja per symbol (siatka, foldy, koszty, run, max_attempts)
+#   data/{symbol}.pkl          seria Close (+ opcjonalnie Sentiment wyrównany as-of do Close)
+#   pending/{id}.json          zadania (symbol, fold, paczka konfiguracji wskaźników); id = {run}-t{n},
+#                              run = znacznik czasu submit (hex) — późniejszy przebieg ma większe run
+#   claimed/{id}@{worker}.json zadanie pobrane atomowym rename(); mtime = heartbeat workera
+#   results/{id}.json          zwarta telemetria (top-K + marginalne statystyki)
+#   errors/{id}.json           zadanie po max_attempts nieudanych próbach (+ {id}@{worker}.txt z błędem)
+#   STOP                       sygnał zakończenia dla workerów
+#
+# Jeden przebieg na katalog naraz: submit() czyści pozostałości poprzedniego, a spóźnione
+# wyniki starego przebiegu (inne run w id) są ignorowane.
+#
+#   koordynator:  walk_forward_distributed(...) albo submit(...) + collect(...)
+#   worker:       python -m core.distributed worker --queue /shared/q
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import socket
+import time
+import uuid
+from itertools import product
+
+import pandas as pd
+
+from .align import AlignedData, align_to
+from .autotune import (Fold, make_folds, indicator_combos, candidates_per_combo, iter_candidate_batches,
+                       SweepTelemetry, state_from_telemetry, _rank)
+
+_DIRS = ("data", "pending", "claimed", "results", "errors")
+
+
+def _write_json(path: str, obj):
+    tmp = f"{path}.tmp.{socket.gethostname()}.{uuid.uuid4().hex}"  # katalog wspólny dla hostów — pid nie wystarcza
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)  # atomowo: czytelnik nigdy nie widzi połowy pliku
+
+
+def _read_json(path: str):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _clear(queue_dir: str):
+    for d in ("pending", "claimed", "results", "errors"):
+        for name in os.listdir(os.path.join(queue_dir, d)):
+            try:
+                os.remove(os.path.join(queue_dir, d, name))
+            except FileNotFoundError:
+                pass  # równolegle zabrane przez workera
+
+
+def _split(data):
+    if isinstance(data, tuple):
+        close, sent = data
+        return close.dropna(), sent
+    if isinstance(data, pd.DataFrame):
+        sent = data["Sentiment"] if "Sentiment" in data else None
+        return data["Close"].dropna(), sent
+    return data.dropna(), None
+
+
+def submit(queue_dir: str, universe: dict, space: dict, folds: int = 4, cost_bps: int = 10,
+           scheme: str = "equal", train_size: int | None = None, test_size: int | None = None,
+           purge: int = 0, embargo: int = 0, top_k: int = 20, chunk: int = 4, max_attempts: int = 3) -> list:
+    """
+    Rozpisz zadania (symbol, fold, paczka `chunk` konfiguracji wskaźników) do kolejki.
+    universe: {symbol: Close (Series), (Close, Sentiment) albo DataFrame z kolumnami Close[, Sentiment]};
+    sentyment na własnym kalendarzu jest dołączany as-of (align_to) — jak w tune().
+    Każdy submit to nowy przebieg (run) — wyniki poprzedniego w tym katalogu są usuwane.
+    """
+    for d in _DIRS:
+        os.makedirs(os.path.join(queue_dir, d), exist_ok=True)
+    stop = os.path.join(queue_dir, "STOP")
+    if os.path.exists(stop):
+        os.remove(stop)
+    _clear(queue_dir)
+    run = f"{time.time_ns():016x}"
+    combos = indicator_combos(space)
+    per_combo = candidates_per_combo(space)
+    manifest = {"run": run, "space": space, "cost_bps": cost_bps, "top_k": top_k, "scheme": scheme, "purge": purge,
+                "max_attempts": max_attempts, "symbols": {}, "tasks": []}
+    tasks = []
+    for symbol, data in universe.items():
+        close, sent = _split(data)
+        frame = pd.DataFrame({"Close": close})
+        if sent is not None:
+            frame["Sentiment"] = align_to(sent, close.index, 0)
+        frame.to_pickle(os.path.join(queue_dir, "data", f"{symbol}.pkl"))
+        fold_list = make_folds(len(close), folds, scheme, train_size, test_size, purge, embargo)
+        manifest["symbols"][symbol] = {"folds": [[fd.index, fd.train, fd.test] for fd in fold_list]}
+        for (i, fd), c0 in product(enumerate(fold_list), range(0, len(combos), chunk)):
+            tasks.append({"id": f"{run}-t{len(tasks):06d}", "run": run, "symbol": symbol, "fold": i, "train": fd.train,
+                          "combos": combos[c0:c0 + chunk], "seq": c0 * per_combo, "attempt": 1})
+    manifest["tasks"] = [t["id"] for t in tasks]
+    _write_json(os.path.join(queue_dir, "manifest.json"), manifest)  # przed zadaniami: worker zawsze go znajdzie
+    for task in tasks:
+        _write_json(os.path.join(queue_dir, "pending", f"{task['id']}.json"), task)
+    return manifest["tasks"]
+
+
+def _claim(queue_dir: str, worker_id: str):
+    pending = os.path.join(queue_dir, "pending")
+    for name in sorted(os.listdir(pending)):
+        if not name.endswith(".json"):
+            continue
+        if os.path.exists(os.path.join(queue_dir, "results", name)):
+            try:
+                os.remove(os.path.join(pending, name))  # duplikat po ponowieniu — wynik już jest
+            except FileNotFoundError:
+                pass
+            continue
+        dst = os.path.join(queue_dir, "claimed", f"{name[:-5]}@{worker_id}.json")
+        try:
+            os.rename(os.path.join(pending, name), dst)  # wygrywa dokładnie jeden worker
+        except FileNotFoundError:
+            continue
+        os.utime(dst)
+        return dst
+    return None
+
+
+def _requeue(queue_dir: str, claimed_path: str, max_attempts: int) -> dict | None:
+    """Oddaj zadanie do pending/; po max_attempts próbach trafia do errors/ i nie wraca do kolejki."""
+    try:
+        task = _read_json(claimed_path)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    task["attempt"] += 1
+    dest = "pending" if task["attempt"] <= max_attempts else "errors"
+    _write_json(os.path.join(queue_dir, dest, f"{task['id']}.json"), task)
+    try:
+        os.remove(claimed_path)
+    except FileNotFoundError:
+        pass
+    return task
+
+
+def _release(queue_dir: str, claimed_path: str, task: dict):
+    try:
+        os.rename(claimed_path, os.path.join(queue_dir, "pending", f"{task['id']}.json"))
+    except FileNotFoundError:
+        pass
+
+
+def _heartbeat(batches, path: str, every: float = 2.0):
+    last = time.monotonic()
+    for batch in batches:
+        if time.monotonic() - last > every:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass  # zadanie oddane do ponowienia — wynik i tak jest deterministyczny
+            last = time.monotonic()
+        yield batch
+
+
+def _load_data(queue_dir: str, symbol: str) -> AlignedData:
+    frame = pd.read_pickle(os.path.join(queue_dir, "data", f"{symbol}.pkl"))
+    return AlignedData.build(frame["Close"], frame["Sentiment"] if "Sentiment" in frame else None)
+
+
+def run_task(queue_dir: str, task: dict, manifest: dict, cache: dict, claimed_path: str | None = None) -> dict:
+    symbol = task["symbol"]
+    if symbol not in cache:
+        cache[symbol] = _load_data(queue_dir, symbol)
+    data = cache[symbol]
+    batches = iter_candidate_batches(data.series("close"), data.series("sentiment"), manifest["space"],
+                                     [tuple(c) for c in task["combos"]])
+    if claimed_path:
+        batches = _heartbeat(batches, claimed_path)
+    fold = Fold(task["fold"] + 1, [tuple(seg) for seg in task["train"]])
+    tel = _rank(batches, data, [fold], manifest["cost_bps"], manifest["top_k"], task["seq"])
+    return tel.to_dict()
+
+
+def run_worker(queue_dir: str, worker_id: str | None = None, poll: float = 0.5, idle_exit: float | None = None) -> int:
+    """Pobieraj i licz zadania aż do STOP (albo idle_exit sekund bez pracy). Zwraca liczbę wykonanych zadań."""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    cache, manifest, manifest_mtime, done = {}, None, None, 0
+    idle_since = time.monotonic()
+    while True:
+        if os.path.exists(os.path.join(queue_dir, "STOP")):
+            return done
+        claimed = _claim(queue_dir, worker_id)
+        if claimed is None:
+            if idle_exit is not None and time.monotonic() - idle_since > idle_exit:
+                return done
+            time.sleep(poll)
+            continue
+        mpath = os.path.join(queue_dir, "manifest.json")
+        if manifest is None or os.path.getmtime(mpath) != manifest_mtime:
+            # nowy submit w tym samym katalogu → świeży manifest i dane
+            manifest_mtime, manifest, cache = os.path.getmtime(mpath), _read_json(mpath), {}
+        task = _read_json(claimed)
+        if task.get("run") != manifest.get("run"):
+            # mtime mógł nie drgnąć (zgrubne mtime na NFS) — przed decyzją zawsze czytamy manifest od nowa
+            manifest_mtime, manifest, cache = os.path.getmtime(mpath), _read_json(mpath), {}
+        if task.get("run") != manifest.get("run"):
+            if task.get("run", "") < manifest["run"]:
+                try:
+                    os.remove(claimed)  # zadanie z poprzedniego przebiegu w tym katalogu
+                except FileNotFoundError:
+                    pass
+            else:
+                _release(queue_dir, claimed, task)  # nowszy przebieg niż widoczny manifest — oddaj bez zmian
+                time.sleep(poll)
+            continue
+        t0 = time.perf_counter()
+        try:
+            tel = run_task(queue_dir, task, manifest, cache, claimed)
+        except Exception as e:
+            with open(os.path.join(queue_dir, "errors", f"{task['id']}@{worker_id}.txt"), "w", encoding="utf-8") as f:
+                f.write(repr(e))
+            _requeue(queue_dir, claimed, manifest["max_attempts"])
+            continue
+        _write_json(os.path.join(queue_dir, "results", f"{task['id']}.json"),
+                    {"id": task["id"], "symbol": task["symbol"], "fold": task["fold"], "worker": worker_id,
+                     "seconds": time.perf_counter() - t0, "telemetry": tel})
+        try:
+            os.remove(claimed)
+        except FileNotFoundError:
+            pass
+        done += 1
+        idle_since = time.monotonic()
+
+
+def collect(queue_dir: str, lease: float = 60.0, poll: float = 0.5, timeout: float | None = None) -> dict:
+    """
+    Czekaj na wszystkie wyniki bieżącego przebiegu; zadania bez heartbeatu dłużej niż `lease` wracają do kolejki.
+    Scalanie w kolejności id zadań → wynik deterministyczny niezależnie od liczby i tempa workerów.
+    Zwraca {symbol: TuneState}.
+    """
+    manifest = _read_json(os.path.join(queue_dir, "manifest.json"))
+    max_attempts = manifest["max_attempts"]
+    results_dir = os.path.join(queue_dir, "results")
+    claimed_dir = os.path.join(queue_dir, "claimed")
+    errors_dir = os.path.join(queue_dir, "errors")
+    t_start = time.monotonic()
+    while True:
+        done = {n[:-5] for n in os.listdir(results_dir) if n.endswith(".json")}
+        if all(t in done for t in manifest["tasks"]):
+            break
+        failed = sorted(t for t in manifest["tasks"] if os.path.exists(os.path.join(errors_dir, f"{t}.json")))
+        if failed:
+            task = _read_json(os.path.join(errors_dir, f"{failed[0]}.json"))
+            raise RuntimeError(f"Zadanie {task['id']} ({task['symbol']}, fold {task['fold'] + 1}) "
+                               f"nie powiodło się {max_attempts}×; zobacz {errors_dir}.")
+        now = time.time()
+        for name in os.listdir(claimed_dir):
+            path = os.path.join(claimed_dir, name)
+            if name.split("@")[0] in done:
+                continue
+            try:
+                stale = now - os.path.getmtime(path) > lease
+            except FileNotFoundError:
+                continue
+            if stale:
+                _requeue(queue_dir, path, max_attempts)
+        if timeout is not None and time.monotonic() - t_start > timeout:
+            raise TimeoutError(f"collect(): brak {len(manifest['tasks']) - len(done)} wyników po {timeout}s.")
+        time.sleep(poll)
+
+    states = {}
+    for symbol, meta in manifest["symbols"].items():
+        fold_list = [Fold(i, [tuple(seg) for seg in train], tuple(test)) for i, train, test in meta["folds"]]
+        tel = SweepTelemetry(len(fold_list), manifest["top_k"])
+        for tid in manifest["tasks"]:
+            res = _read_json(os.path.join(results_dir, f"{tid}.json"))
+            if res["symbol"] == symbol:
+                tel.absorb(res["telemetry"], [res["fold"]])
+        states[symbol] = state_from_telemetry(_load_data(queue_dir, symbol), fold_list, tel,
+                                              manifest["scheme"], manifest["cost_bps"], manifest["purge"])
+    return states
+
+
+def walk_forward_distributed(queue_dir: str, universe: dict, space: dict, workers: int = 0,
+                             lease: float = 60.0, max_attempts: int = 3, timeout: float | None = None, **kw) -> dict:
+    """submit + (opcjonalnie) `workers` lokalnych procesów + collect; zdalne workery mogą dołączyć w każdej chwili."""
+    submit(queue_dir, universe, space, max_attempts=max_attempts, **kw)
+    procs = [mp.Process(target=run_worker, args=(queue_dir, f"{socket.gethostname()}-local{i}"), daemon=True)
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+    try:
+        return collect(queue_dir, lease=lease, timeout=timeout)
+    finally:
+        open(os.path.join(queue_dir, "STOP"), "w").close()
+        for p in procs:
+            p.join(timeout=5)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Rozproszony walk-forward: worker kolejki plikowej.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("worker")
+    w.add_argument("--queue", required=True, help="katalog kolejki (wspólny dla hostów)")
+    w.add_argument("--id", default=None)
+    w.add_argument("--idle-exit", type=float, default=None, help="zakończ po N s bez zadań")
+    args = ap.parse_args(argv)
+    if args.cmd == "worker":
+        n = run_worker(args.queue, args.id, idle_exit=args.idle_exit)
+        print(f"Wykonano zadań: {n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+def _x_values(index: pd.Index) -> np.ndarray:
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype(float)
+    try:
+        return np.asarray(index, dtype=float)
+    except (TypeError, ValueError):
+        return np.arange(len(index), dtype=float)
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: pozycje n_out punktów najlepiej oddających kształt serii.
+    Pierwszy i ostatni punkt zawsze zostają; NaN-y są pomijane.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if n <= n_out:
+        return valid
+    if n_out < 3:
+        return valid[[0, -1]]
+    xv, yv = x[valid], y[valid]
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        cx, cy = xv[nlo:nhi].mean(), yv[nlo:nhi].mean()
+        area = np.abs((xv[a] - cx) * (yv[lo:hi] - yv[a]) - (xv[a] - xv[lo:hi]) * (cy - yv[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return valid[out]
+
+def downsample(s: pd.Series, n_out: int = 2000, keep_extremes: bool = True) -> pd.Series:
+    """Seria zredukowana LTTB do budżetu n_out punktów (+ globalne min/max, gdy keep_extremes)."""
+    if len(s) <= n_out:
+        return s
+    y = s.to_numpy(dtype=float)
+    idx = lttb_indices(_x_values(s.index), y, n_out)
+    if keep_extremes and not np.isnan(y).all():
+        idx = np.union1d(idx, [np.nanargmin(y), np.nanargmax(y)])
+    return s.iloc[idx]
+
+def downsample_frame(df: pd.DataFrame, n_out: int = 2000, keep_extremes: bool = True) -> dict:
+    """Każda kolumna osobno pod tym samym budżetem punktów (do nakładek na wykresie)."""
+    return {c: downsample(df[c].dropna(), n_out, keep_extremes) for c in df.columns}
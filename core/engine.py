@@ -0,0 +1,94 @@
+import threading
+import time
+from dataclasses import replace
+import pandas as pd
+from .signals import SignalParams, compute_features, partial_signals, ensemble_score, dynamic_thresholds
+from .align import align_to
+
+def recommend(score: float, buy_thr: float, sell_thr: float) -> str:
+    if score >= buy_thr:
+        return "BUY"
+    if score <= sell_thr:
+        return "SELL"
+    return "HOLD"
+
+class SignalEngine:
+    """
+    Ciepły stan jednego symbolu: seria Close + ostatnio policzony sygnał.
+    Odczyt (snapshot) nie liczy nic — zwraca gotowy słownik; push() dolicza nowe bary i podmienia wynik.
+    """
+
+    def __init__(self, symbol: str, close: pd.Series, params: SignalParams | None = None,
+                 sentiment: pd.Series | None = None):
+        self.symbol = symbol
+        self.params = replace(params) if params is not None else SignalParams()
+        self.close = close.dropna().sort_index().astype(float)
+        self.sentiment = sentiment
+        self._lock = threading.Lock()
+        self._snapshot = self._compute()
+
+    def _compute(self) -> dict:
+        t0 = time.perf_counter()
+        p = self.params
+        sent = None if self.sentiment is None else align_to(self.sentiment, self.close.index, 0)
+        score = ensemble_score(partial_signals(compute_features(self.close, p), p), sent, p)
+        buy_thr, sell_thr = dynamic_thresholds(score, p)
+        last = float(score.iloc[-1])
+        buy_now = float(buy_thr.iloc[-1] if isinstance(buy_thr, pd.Series) else buy_thr)
+        sell_now = float(sell_thr.iloc[-1] if isinstance(sell_thr, pd.Series) else sell_thr)
+        return {
+            "symbol": self.symbol,
+            "date": self.close.index[-1].isoformat(),
+            "close": float(self.close.iloc[-1]),
+            "bars": len(self.close),
+            "score": last,
+            "buy_thr": buy_now,
+            "sell_thr": sell_now,
+            "action": recommend(last, buy_now, sell_now),
+            "compute_ms": (time.perf_counter() - t0) * 1000,
+        }
+
+    def snapshot(self) -> dict:
+        return self._snapshot
+
+    def push(self, bars: pd.Series) -> dict:
+        """Dopisz nowe bary (późniejsze niż ostatni; bar z tą samą datą nadpisuje ostatni) i przelicz sygnał."""
+        bars = bars.dropna().sort_index().astype(float)
+        if bars.empty:
+            return self._snapshot
+        with self._lock:
+            if bars.index[0] < self.close.index[-1]:
+                raise ValueError(f"{self.symbol}: bary starsze niż ostatni ({self.close.index[-1].date()}).")
+            self.close = pd.concat([self.close[self.close.index < bars.index[0]], bars])
+            self._snapshot = self._compute()
+        return self._snapshot
+
+class EngineRegistry:
+    """Silniki per symbol w pamięci procesu; params/sentiment — wspólne dla symboli bez własnych."""
+
+    def __init__(self, params: SignalParams | None = None, sentiment: pd.Series | None = None):
+        self.params = params
+        self.sentiment = sentiment
+        self._engines: dict[str, SignalEngine] = {}
+        self._lock = threading.Lock()
+
+    def symbols(self) -> list[str]:
+        return sorted(self._engines)
+
+    def get(self, symbol: str) -> SignalEngine | None:
+        return self._engines.get(symbol.lower())
+
+    def load(self, symbol: str, close: pd.Series, sentiment: pd.Series | None = None,
+             params: SignalParams | None = None) -> SignalEngine:
+        eng = SignalEngine(symbol.lower(), close, params or self.params,
+                           self.sentiment if sentiment is None else sentiment)
+        with self._lock:
+            self._engines[symbol.lower()] = eng
+        return eng
+
+    def push(self, symbol: str, bars: pd.Series) -> dict:
+        """Dopisz bary do wczytanego symbolu; nieznany symbol → KeyError (historia tylko przez load())."""
+        eng = self.get(symbol)
+        if eng is None:
+            raise KeyError(symbol)
+        return eng.push(bars)
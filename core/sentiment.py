@@ -1,4 +1,5 @@
 import pandas as pd
+from .align import align_to
 
 def from_csv(file) -> pd.Series:
     df = pd.read_csv(file)
@@ -19,4 +20,4 @@ def heuristic_from_vix(vix_close: pd.Series, span:int=10, cap:float=0.85) -> pd.
         z = (v.clip(p5, p95) - p5) / (p95 - p5)
         s = 1 - 2*z
     s = ewma(s, span=span).clip(-cap, cap)
-    return s.reindex(vix_close.index).fillna(method="ffill").fillna(0)
+    return align_to(s, vix_close.index, 0)
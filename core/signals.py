@@ -1,7 +1,9 @@
 from dataclasses import dataclass
+import numpy as np
 import pandas as pd
 from .indicators import rsi, sma, ema, bollinger_bands, swings
 from .regime import market_regime
+from .align import align_to
 
 @dataclass
 class SignalParams:
@@ -25,6 +27,10 @@ class SignalParams:
     percentile_mode: bool = True
     percentile_window: int = 90
 
+# score ma dyskretne wartości, a progi percentylowe często trafiają dokładnie w nie;
+# zaokrąglenie usuwa szum kolejności sumowania (Series vs macierz K kolumn), żeby >= / <= działały identycznie
+SCORE_DECIMALS = 12
+
 def _ma(close: pd.Series, win:int, typ:str):
     return ema(close, win) if typ=="ema" else sma(close, win)
 
@@ -62,8 +68,8 @@ def partial_signals(feat: pd.DataFrame, p: SignalParams) -> pd.DataFrame:
 def ensemble_score(sig: pd.DataFrame, sentiment: pd.Series | None, p: SignalParams) -> pd.Series:
     sc = (p.w_rsi*sig["sig_rsi"] + p.w_ma*sig["sig_ma"] + p.w_bb*sig["sig_bb"] + p.w_breakout*sig["sig_breakout"])
     if sentiment is not None:
-        sc = sc + p.w_sent*sentiment.reindex(sig.index).fillna(method="ffill").fillna(0)
-    return sc.clip(-1,1)
+        sc = sc + p.w_sent*align_to(sentiment, sig.index, 0)
+    return sc.clip(-1,1).round(SCORE_DECIMALS)
 
 def dynamic_thresholds(score: pd.Series, p: SignalParams):
     if not p.percentile_mode:
@@ -74,6 +80,37 @@ def dynamic_thresholds(score: pd.Series, p: SignalParams):
     sell_thr = roll.quantile(0.20).fillna(p.score_sell)
     return buy_thr, sell_thr
 
+WEIGHT_FIELDS = ("w_rsi", "w_ma", "w_bb", "w_breakout", "w_sent")
+VOTE_COLUMNS = ("sig_rsi", "sig_ma", "sig_bb", "sig_breakout")
+
+def vote_matrix(sig: pd.DataFrame, sentiment: pd.Series | None) -> np.ndarray:
+    """(T x 5): głosy sygnałów cząstkowych + wyrównany sentyment, w kolejności WEIGHT_FIELDS."""
+    votes = np.zeros((len(sig), len(WEIGHT_FIELDS)))
+    votes[:, :4] = sig[list(VOTE_COLUMNS)].to_numpy(dtype=float)
+    if sentiment is not None:
+        votes[:, 4] = align_to(sentiment, sig.index, 0).to_numpy(dtype=float)
+    return votes
+
+def weight_matrix(params) -> np.ndarray:
+    """(5 x K): wagi kolejnych kandydatów jako kolumny."""
+    return np.array([[getattr(p, f) for p in params] for f in WEIGHT_FIELDS], dtype=float).reshape(len(WEIGHT_FIELDS), -1)
+
+def ensemble_scores(votes: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Score dla K zestawów wag naraz: (T x 5) @ (5 x K) + clip — odpowiednik ensemble_score kolumna po kolumnie."""
+    return np.clip(votes @ weights, -1, 1).round(SCORE_DECIMALS)
+
+def rolling_quantiles(scores: np.ndarray, window: int):
+    """Kroczące kwantyle 0.8/0.2 dla wszystkich kolumn naraz (NaN w rozbiegu)."""
+    roll = pd.DataFrame(scores).rolling(window)
+    return roll.quantile(0.80).to_numpy(), roll.quantile(0.20).to_numpy()
+
+def dynamic_thresholds_batch(scores: np.ndarray, p: SignalParams, quantiles=None):
+    """Jak dynamic_thresholds, ale dla macierzy (T x K); quantiles można podać z rolling_quantiles (cache per okno)."""
+    if not p.percentile_mode:
+        return p.score_buy, p.score_sell
+    q_hi, q_lo = quantiles if quantiles is not None else rolling_quantiles(scores, p.percentile_window)
+    return np.where(np.isnan(q_hi), p.score_buy, q_hi), np.where(np.isnan(q_lo), p.score_sell, q_lo)
+
 def confidence_and_explain(sig, score, buy_thr, sell_thr, p):
     import numpy as np
     idx = score.index
@@ -0,0 +1,109 @@
+# core/snapshot.py — zrzut stanu sesji na dysk (kolumny + meta w jednym .npz) i leniwe odtwarzanie
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import time
+import uuid
+import zipfile
+import zlib
+
+import numpy as np
+import pandas as pd
+
+__all__ = ["fingerprint", "save_snapshot", "Snapshot", "latest_snapshot", "SNAPSHOT_ERRORS"]
+
+_INDEX = "__index__"
+_META = "__meta__"
+
+# wszystko, czym może skończyć się czytanie uszkodzonego/obcego zrzutu — wołający traktuje to jak brak zrzutu
+SNAPSHOT_ERRORS = (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile, zlib.error)
+
+
+def fingerprint(close: pd.Series, *parts) -> str:
+    """Krótki identyfikator danych + parametrów — czy zrzut pasuje do bieżącego stanu (hash wszystkich barów)."""
+    h = hashlib.sha1()
+    idx = close.index
+    h.update(np.ascontiguousarray(idx.asi8 if isinstance(idx, pd.DatetimeIndex) else idx.to_numpy()).tobytes())
+    h.update(np.ascontiguousarray(close.to_numpy(dtype=float)).tobytes())
+    h.update(json.dumps(parts, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _safe(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name) or "default"
+
+
+def save_snapshot(directory: str, name: str, frames: dict, meta: dict) -> str:
+    """
+    Zapisz {klucz: DataFrame/Series} jako kolumny w jednym .npz (skompresowane), meta w tym samym pliku.
+    Jeden plik = jedna publikacja (unikalny tmp + replace): sesje-wątki i procesy piszące ten sam zrzut
+    nie mieszają kolumn ani meta — czytelnik widzi w całości jedną z wersji.
+    """
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, _safe(name))
+    arrays, layout = {}, {}
+    for key, obj in frames.items():
+        if obj is None:
+            continue
+        is_series = isinstance(obj, pd.Series)
+        df = obj.to_frame(name=obj.name if obj.name is not None else key) if is_series else obj
+        cols = [str(c) for c in df.columns]
+        layout[key] = {"series": is_series, "columns": cols, "datetime": isinstance(df.index, pd.DatetimeIndex)}
+        idx = df.index
+        arrays[f"{key}:{_INDEX}"] = idx.asi8 if isinstance(idx, pd.DatetimeIndex) else np.asarray(idx)
+        for c, col in zip(cols, df.columns):
+            arr = df[col].to_numpy()
+            arrays[f"{key}:{c}"] = arr.astype(str) if arr.dtype == object else arr
+    arrays[_META] = np.array(json.dumps(dict(meta, layout=layout, saved_at=time.time()), default=str))
+    tmp = f"{base}.{uuid.uuid4().hex}.tmp.npz"
+    try:
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, f"{base}.npz")
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return base
+
+
+class Snapshot:
+    """Meta czytane od razu (mały wpis w .npz); kolumny dekompresowane dopiero przy pierwszym frame(klucz)."""
+
+    def __init__(self, base: str):
+        self.base = base
+        self._npz = np.load(f"{base}.npz", allow_pickle=False)
+        self.meta = json.loads(self._npz[_META].item())
+        self._frames: dict = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.meta.get("layout", {})
+
+    def frame(self, key: str):
+        if key not in self._frames:
+            if key not in self:
+                raise KeyError(key)
+            lay = self.meta["layout"][key]
+            raw = self._npz[f"{key}:{_INDEX}"]
+            idx = pd.DatetimeIndex(raw.astype("datetime64[ns]")) if lay["datetime"] else pd.Index(raw)
+            df = pd.DataFrame({c: self._npz[f"{key}:{c}"] for c in lay["columns"]}, index=idx)
+            self._frames[key] = df.iloc[:, 0] if lay["series"] else df
+        return self._frames[key]
+
+
+def latest_snapshot(directory: str, name: str | None = None) -> Snapshot | None:
+    """Zrzut o podanej nazwie albo najświeższy w katalogu; None gdy brak/uszkodzony."""
+    if name is not None:
+        paths = [os.path.join(directory, f"{_safe(name)}.npz")]
+    else:
+        paths = sorted((p for p in glob.glob(os.path.join(directory, "*.npz")) if not p.endswith(".tmp.npz")),
+                       key=os.path.getmtime, reverse=True)
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            return Snapshot(path[:-4])
+        except SNAPSHOT_ERRORS:
+            continue
+    return None
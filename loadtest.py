@@ -0,0 +1,86 @@
+# loadtest.py — opóźnienia GET /signal/{symbol} przy równoległych klientach (p50/p99)
+#
+#   python loadtest.py --symbol btcpln --clients 16 --requests 500
+#   python loadtest.py --unix /tmp/signals.sock --symbol btcpln
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import socket
+import statistics
+import threading
+import time
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = 5):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def _client(make_conn, path: str, n: int, out: list, errors: list):
+    conn = make_conn()  # jedno połączenie keep-alive na klienta
+    lat = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            body = resp.read()
+            if resp.status != 200:
+                errors.append(resp.status)
+                continue
+            json.loads(body)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(repr(e))
+            conn.close()
+            conn = make_conn()
+            continue
+        lat.append((time.perf_counter() - t0) * 1000)
+    conn.close()
+    out.extend(lat)
+
+
+def run(make_conn, symbol: str, clients: int, requests: int) -> dict:
+    path = f"/signal/{symbol}"
+    lat, errors = [], []
+    threads = [threading.Thread(target=_client, args=(make_conn, path, requests, lat, errors)) for _ in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    if not lat:
+        return {"ok": 0, "errors": len(errors)}
+    q = statistics.quantiles(lat, n=100)
+    return {"ok": len(lat), "errors": len(errors), "rps": len(lat) / wall,
+            "p50_ms": q[49], "p99_ms": q[98], "max_ms": max(lat)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Test obciążenia serwisu sygnałów.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--unix")
+    ap.add_argument("--symbol", required=True)
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=500, help="żądań na klienta")
+    args = ap.parse_args(argv)
+
+    if args.unix:
+        make_conn = lambda: UnixHTTPConnection(args.unix)
+    else:
+        make_conn = lambda: http.client.HTTPConnection(args.host, args.port, timeout=5)
+    res = run(make_conn, args.symbol, args.clients, args.requests)
+    print(" • ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in res.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# service.py — lokalny serwis HTTP z sygnałami (ciepły stan silnika w pamięci)
+#
+#   python service.py --stooq btcpln --port 8765
+#   python service.py --csv btcpln=btcpln.csv --unix /tmp/signals.sock
+#   python service.py --stooq btcpln --params .snapshots/btcpln-D1.npz --vix   # parametry/sentyment jak w app.py
+#
+#   GET  /signal/{symbol}   → score, progi, akcja (z pamięci, bez przeliczania)
+#   POST /bars/{symbol}     → {"bars": [{"date": "2024-01-02", "close": 123.4}, ...]} — dopisuje i przelicza
+#   GET  /health            → lista symboli
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+from dataclasses import fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from core.data import from_csv, from_stooq, load_stooq
+from core.engine import EngineRegistry
+from core.sentiment import heuristic_from_vix
+from core.snapshot import Snapshot
+from core.signals import SignalParams
+
+
+def _bars_from_json(payload) -> pd.Series:
+    rows = payload.get("bars", [payload]) if isinstance(payload, dict) else payload
+    if not rows:
+        raise ValueError("Brak barów w żądaniu.")
+    idx = pd.to_datetime([r["date"] for r in rows]).tz_localize(None)
+    return pd.Series([float(r["close"]) for r in rows], index=idx, name="Close")
+
+
+def load_params(path: str) -> SignalParams:
+    """SignalParams z JSON (same pola) albo z meta zrzutu app.py (.snapshots/{symbol}-{interval}.npz)."""
+    if path.endswith(".npz"):
+        raw = Snapshot(path[:-4]).meta
+    else:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    raw = raw.get("signal_params", raw)
+    known = {f.name for f in fields(SignalParams)}
+    unknown = sorted(set(raw) - known)
+    if unknown:
+        raise ValueError(f"{path}: nieznane pola SignalParams: {', '.join(unknown)}")
+    return SignalParams(**raw)
+
+
+def make_handler(registry: EngineRegistry):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive dla klientów z pulą połączeń
+
+        def setup(self):
+            super().setup()
+            if isinstance(self.client_address, tuple):
+                # nagłówki i body idą osobnymi zapisami — bez NODELAY Nagle + delayed ACK daje ~40 ms
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def _send(self, code: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if parts == ["health"]:
+                return self._send(200, {"ok": True, "symbols": registry.symbols()})
+            if len(parts) == 2 and parts[0] == "signal":
+                eng = registry.get(parts[1])
+                if eng is None:
+                    return self._send(404, {"error": f"Nieznany symbol: {parts[1]}"})
+                return self._send(200, eng.snapshot())
+            self._send(404, {"error": "Nieznana ścieżka."})
+
+        def do_POST(self):
+            parts = self.path.strip("/").split("/")
+            if len(parts) != 2 or parts[0] != "bars":
+                return self._send(404, {"error": "Nieznana ścieżka."})
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)  # zawsze czytamy body — inaczej keep-alive się rozjedzie
+            if registry.get(parts[1]) is None:
+                return self._send(404, {"error": f"Nieznany symbol: {parts[1]} (wczytaj historię przy starcie)"})
+            try:
+                bars = _bars_from_json(json.loads(body or b"{}"))
+                self._send(200, registry.push(parts[1], bars))
+            except (ValueError, KeyError, TypeError) as e:
+                self._send(400, {"error": str(e)})
+
+        def address_string(self):
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def log_message(self, fmt, *args):
+            pass  # logowanie każdego żądania zabija opóźnienia
+
+    return Handler
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+
+def build_server(registry: EngineRegistry, host: str = "127.0.0.1", port: int = 8765, unix: str | None = None):
+    handler = make_handler(registry)
+    if unix:
+        if os.path.exists(unix):
+            os.unlink(unix)
+        return ThreadingUnixHTTPServer(unix, handler)
+    return _TCPHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Lokalny serwis sygnałów (core.signals + ciepły stan w pamięci).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--unix", help="ścieżka gniazda Unix zamiast TCP")
+    ap.add_argument("--stooq", action="append", default=[], help="symbol do wczytania ze Stooq (można powtarzać)")
+    ap.add_argument("--csv", action="append", default=[], help="SYMBOL=plik.csv (można powtarzać)")
+    ap.add_argument("--params", help="JSON z SignalParams albo meta zrzutu app.py (signal_params)")
+    ap.add_argument("--vix", action="store_true", help="sentyment z VIX (heuristic_from_vix) jak w app.py")
+    args = ap.parse_args(argv)
+
+    params = load_params(args.params) if args.params else None
+    sentiment = heuristic_from_vix(from_stooq("^vix")["Close"]) if args.vix else None
+    registry = EngineRegistry(params, sentiment)
+    for sym in args.stooq:
+        df, info = load_stooq(sym)
+        registry.load(sym, df["Close"])
+        print(f"{sym}: {len(df)} barów ({info['source']})")
+    for spec in args.csv:
+        sym, _, path = spec.partition("=")
+        df = from_csv(path)
+        registry.load(sym, df["Close"])
+        print(f"{sym}: {len(df)} barów (CSV)")
+
+    server = build_server(registry, args.host, args.port, args.unix)
+    print(f"Nasłuch: {args.unix or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()